@@ -0,0 +1,137 @@
+import time
+import threading
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+# =====================================================
+# EXISTENCE CHECKS (dùng chung cho nckhgetposts.py / nckhgetcmt.py)
+# =====================================================
+def find_existing_ids(collection, ids):
+    """Tập _id (trong `ids`) đã có trong collection: 1 query $in, chỉ trả về _id."""
+    if not ids:
+        return set()
+    return {d["_id"] for d in collection.find({"_id": {"$in": list(ids)}}, {"_id": 1})}
+
+# =====================================================
+# BUFFERED BULK WRITES (dùng chung cho nckhgetposts.py / nckhgetcmt.py)
+# =====================================================
+BULK_SIZE = 500        # flush khi buffer đủ số document này
+FLUSH_INTERVAL = 2.0   # hoặc khi document cũ nhất trong buffer đã chờ quá số giây này
+FLUSH_RETRIES = 2      # số lần ghi lại các document lỗi của 1 batch
+
+
+class BulkWriter:
+    """
+    Gom document rồi ghi bằng 1 lệnh bulk_write (UpdateOne upsert theo _id, unordered)
+    thay vì 1 update_one / document. Gọi được từ nhiều thread; 1 thread nền flush buffer
+    quá FLUSH_INTERVAL kể cả khi không có document mới (crawler đang chờ rate limit).
+
+    Unordered: document lỗi không chặn các document mới hơn trong batch, nên được ghi lại
+    FLUSH_RETRIES lần. Vẫn lỗi thì _id được in ra khi close(): lần chạy sau dừng ở document
+    mới hơn đã ghi (stop-at-old) và không tự lấy lại document đó.
+    """
+
+    def __init__(self, collection, bulk_size=BULK_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.collection = collection
+        self.bulk_size = bulk_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.first_added = None
+        self.lock = threading.Lock()
+        self.upserted = 0
+        self.modified = 0
+        self.errors = 0
+        self.flushes = 0
+        self.failed_ids = []
+        self.stopped = threading.Event()
+        self.flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self.flusher.start()
+
+    def _due(self):
+        return bool(self.buffer) and (
+            len(self.buffer) >= self.bulk_size
+            or time.monotonic() - self.first_added >= self.flush_interval
+        )
+
+    def _flush_periodically(self):
+        while not self.stopped.wait(self.flush_interval / 2):
+            with self.lock:
+                due = self._due()
+            if due:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"⚠️  Bulk write to '{self.collection.name}' failed: {str(e)}")
+
+    def add(self, doc):
+        with self.lock:
+            if not self.buffer:
+                self.first_added = time.monotonic()
+            self.buffer.append(doc)
+            due = self._due()
+        if due:
+            self.flush()
+
+    def add_many(self, docs):
+        for doc in docs:
+            self.add(doc)
+
+    def _write(self, docs):
+        """1 lệnh bulk_write -> (upserted, modified, document lỗi, lỗi đầu tiên)."""
+        ops = [UpdateOne({"_id": d["_id"]}, {"$set": d}, upsert=True) for d in docs]
+        try:
+            result = self.collection.bulk_write(ops, ordered=False)
+            return result.upserted_count, result.modified_count, [], None
+        except BulkWriteError as e:
+            details = e.details or {}
+            write_errors = details.get("writeErrors", [])
+            failed = [docs[err["index"]] for err in write_errors]
+            first = write_errors[0].get("errmsg") if write_errors else str(e)
+            return details.get("nUpserted", 0), details.get("nModified", 0), failed, first
+        except PyMongoError as e:
+            # Lỗi kết nối / timeout: không biết document nào đã ghi -> ghi lại cả batch (upsert idempotent)
+            return 0, 0, docs, str(e)
+
+    def flush(self):
+        with self.lock:
+            docs, self.buffer = self.buffer, []
+        if not docs:
+            return
+
+        upserted = modified = 0
+        pending = docs
+        for _ in range(FLUSH_RETRIES + 1):
+            n_upserted, n_modified, pending, first = self._write(pending)
+            upserted += n_upserted
+            modified += n_modified
+            if not pending:
+                break
+        if pending:
+            print(
+                f"⚠️  Bulk write to '{self.collection.name}': {len(pending)}/{len(docs)} documents "
+                f"failed after {FLUSH_RETRIES} retries ({first})"
+            )
+
+        with self.lock:
+            self.upserted += upserted
+            self.modified += modified
+            self.errors += len(pending)
+            self.failed_ids.extend(d["_id"] for d in pending)
+            self.flushes += 1
+
+    def close(self):
+        self.stopped.set()
+        self.flusher.join()
+        self.flush()
+        print(
+            f"   ➜ '{self.collection.name}': {self.upserted} inserted, {self.modified} updated, "
+            f"{self.errors} failed in {self.flushes} bulk writes"
+        )
+        if self.failed_ids:
+            print(f"   ➜ Not saved (crawl again manually): {', '.join(map(str, self.failed_ids))}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,9 +1,11 @@
 import os
-import time
-import requests
+import asyncio
+import aiohttp
 from datetime import datetime
 from pymongo import MongoClient
 from dotenv import load_dotenv
+from mongo_writer import BulkWriter, find_existing_ids
+from rate_limiter import RateLimiter, request_json_async
 
 # =====================================================
 # LOAD ENV
@@ -19,10 +21,23 @@ DB_NAME = os.getenv("MONGO_DB_NAME")
 POSTS_COLLECTION = os.getenv("MONGO_POSTS_COLLECTION", "posts")
 COMMENTS_COLLECTION = os.getenv("MONGO_COMMENTS_COLLECTION", "comments")
 
+# Số post crawl song song / số request Graph API đang chạy cùng lúc (tính chung mọi post)
+POST_CONCURRENCY = int(os.getenv("CRAWL_POST_CONCURRENCY", "8"))
+REQUEST_CONCURRENCY = int(os.getenv("CRAWL_REQUEST_CONCURRENCY", "16"))
+
 if not ACCESS_TOKEN:
     raise Exception("❌ Missing FB_ACCESS_TOKEN in .env")
 
 BASE_URL = f"https://graph.facebook.com/{GRAPH_VERSION}"
+COMMENT_FIELDS = (
+    "id,"
+    "message,"
+    "like_count,"
+    "created_time,"
+    "reactions.summary(true)"
+)
+# Tốc độ request chung của cả lần crawl, tự chỉnh theo quota (header usage của Graph API)
+LIMITER = RateLimiter()
 
 # =====================================================
 # MONGODB
@@ -32,157 +47,186 @@ db = client[DB_NAME]
 posts_col = db[POSTS_COLLECTION]
 comments_col = db[COMMENTS_COLLECTION]
 
+# =====================================================
+# GRAPH API (ASYNC)
+# =====================================================
+async def fetch_json(session, request_slots, url, params):
+    # request_slots: giới hạn số request đồng thời của cả lần crawl
+    # LIMITER: giãn request theo quota, bị throttle thì backoff rồi gửi lại thay vì bỏ post
+    async with request_slots:
+        return await request_json_async(LIMITER, lambda: session.get(url, params=params))
+
+
+async def iter_pages(session, request_slots, url, params):
+    """Yield `data` của từng page (20 item / page), theo paging.next."""
+    while url:
+        res = await fetch_json(session, request_slots, url, params)
+        yield res.get("data", [])
+
+        url = res.get("paging", {}).get("next")
+        params = None
+
+
+def comment_document(c, post_id, parent_comment_id, permalink_url):
+    return {
+        "_id": c["id"],
+        "post_id": post_id,
+        "parent_comment_id": parent_comment_id,
+        "permalink_url": permalink_url,
+        "message": c.get("message"),
+        "like_count": c.get("like_count", 0),
+        "reactions_count": (
+            c.get("reactions", {})
+             .get("summary", {})
+             .get("total_count", 0)
+        ),
+        "created_time": c.get("created_time"),
+        "fetched_at": datetime.utcnow()
+    }
+
 # =====================================================
 # GET NEW ROOT COMMENTS (20 / PAGE, INCREMENTAL)
 # =====================================================
-def get_new_root_comments(post_id, permalink_url):
+async def get_new_root_comments(session, request_slots, post_id, permalink_url):
     new_comments = []
     url = f"{BASE_URL}/{post_id}/comments"
     params = {
-        "fields": (
-            "id,"
-            "message,"
-            "like_count,"
-            "created_time,"
-            "reactions.summary(true)"
-        ),
+        "fields": COMMENT_FIELDS,
         "limit": 20,
         "access_token": ACCESS_TOKEN
     }
 
-    while url:
-        res = requests.get(url, params=params).json()
-
-        if "error" in res:
-            raise Exception(res["error"])
-
-        for c in res.get("data", []):
+    async for page in iter_pages(session, request_slots, url, params):
+        # 1 query $in cho cả page thay vì find_one từng comment
+        known = await asyncio.to_thread(find_existing_ids, comments_col, [c["id"] for c in page])
+        for c in page:
             comment_id = c["id"]
 
             # 🚨 DỪNG KHI GẶP COMMENT CŨ
-            if comments_col.find_one({"_id": comment_id}):
+            if comment_id in known:
                 print(f"Reached old comment {comment_id} → stop")
                 return new_comments
 
-            doc = {
-                "_id": comment_id,
-                "post_id": post_id,
-                "parent_comment_id": None,
-                "permalink_url": permalink_url,
-                "message": c.get("message"),
-                "like_count": c.get("like_count", 0),
-                "reactions_count": (
-                    c.get("reactions", {})
-                     .get("summary", {})
-                     .get("total_count", 0)
-                ),
-                "created_time": c.get("created_time"),
-                "fetched_at": datetime.utcnow()
-            }
-
-            new_comments.append(doc)
-
-        url = res.get("paging", {}).get("next")
-        params = None
-        time.sleep(0.5)
+            new_comments.append(comment_document(c, post_id, None, permalink_url))
 
     return new_comments
 
 # =====================================================
 # GET REPLIES OF ONE COMMENT (20 / PAGE)
 # =====================================================
-def get_replies(comment_id, post_id, permalink_url):
+async def get_replies(session, request_slots, comment_id, post_id, permalink_url, known_ids):
     replies = []
     url = f"{BASE_URL}/{comment_id}/comments"
     params = {
-        "fields": (
-            "id,"
-            "message,"
-            "like_count,"
-            "created_time,"
-            "reactions.summary(true)"
-        ),
+        "fields": COMMENT_FIELDS,
         "limit": 20,
         "access_token": ACCESS_TOKEN
     }
 
-    while url:
-        res = requests.get(url, params=params).json()
-
-        if "error" in res:
-            raise Exception(res["error"])
-
-        for r in res.get("data", []):
+    async for page in iter_pages(session, request_slots, url, params):
+        for r in page:
             reply_id = r["id"]
 
-            # reply cũng không lưu trùng
-            if comments_col.find_one({"_id": reply_id}):
+            # reply cũng không lưu trùng (known_ids: comment id đã lưu của post, load 1 lần)
+            if reply_id in known_ids:
                 continue
 
-            replies.append({
-                "_id": reply_id,
-                "post_id": post_id,
-                "parent_comment_id": comment_id,
-                "permalink_url": permalink_url,
-                "message": r.get("message"),
-                "like_count": r.get("like_count", 0),
-                "reactions_count": (
-                    r.get("reactions", {})
-                     .get("summary", {})
-                     .get("total_count", 0)
-                ),
-                "created_time": r.get("created_time"),
-                "fetched_at": datetime.utcnow()
-            })
-
-        url = res.get("paging", {}).get("next")
-        params = None
-        time.sleep(0.5)
+            replies.append(comment_document(r, post_id, comment_id, permalink_url))
 
     return replies
 
 # =====================================================
-# MAIN PROCESS
+# KNOWN COMMENT IDS
 # =====================================================
-if __name__ == "__main__":
-    posts = posts_col.find({}, {"_id": 1, "permalink_url": 1})
+def load_known_comment_ids(post_id):
+    return {d["_id"] for d in comments_col.find({"post_id": post_id}, {"_id": 1})}
 
-    for post in posts:
-        post_id = post["_id"]
-        permalink = post.get("permalink_url")
-
-        print(f"\n📌 Crawling comments for post {post_id}")
+# =====================================================
+# SAVE
+# =====================================================
+def save_comments(writer, docs):
+    # Comment cũ trước, mới sau: nếu dừng giữa chừng thì phần đã ghi là phần cũ,
+    # lần chạy sau không dừng sớm ở comment mới mà bỏ sót comment cũ hơn chưa ghi
+    writer.add_many(reversed(docs))
 
-        # =============================
-        # ROOT COMMENTS
-        # =============================
-        try:
-            new_comments = get_new_root_comments(post_id, permalink)
-        except Exception as e:
-            print(f"⚠️  Failed to get comments for post {post_id}: {str(e)}")
+# =====================================================
+# ONE POST
+# =====================================================
+async def crawl_post(session, request_slots, writer, post):
+    post_id = post["_id"]
+    permalink = post.get("permalink_url")
+
+    print(f"\n📌 Crawling comments for post {post_id}")
+
+    # =============================
+    # ROOT COMMENTS
+    # =============================
+    try:
+        new_comments = await get_new_root_comments(session, request_slots, post_id, permalink)
+    except Exception as e:
+        print(f"⚠️  Failed to get comments for post {post_id}: {str(e)}")
+        return 0
+
+    # to_thread: flush (bulk_write) có thể chạy trong lúc add
+    await asyncio.to_thread(save_comments, writer, new_comments)
+
+    # =============================
+    # REPLIES (các thread reply chạy song song)
+    # =============================
+    known_ids = set()
+    if new_comments:
+        known_ids = await asyncio.to_thread(load_known_comment_ids, post_id)
+    results = await asyncio.gather(
+        *(get_replies(session, request_slots, c["_id"], post_id, permalink, known_ids) for c in new_comments),
+        return_exceptions=True
+    )
+    for c, replies in zip(new_comments, results):
+        if isinstance(replies, Exception):
+            print(f"⚠️  Failed to get replies for comment {c['_id']}: {str(replies)}")
             continue
+        await asyncio.to_thread(save_comments, writer, replies)
+
+    print(f"   ➜ Saved {len(new_comments)} new root comments for post {post_id}")
+    return len(new_comments)
+
+# =====================================================
+# MAIN PROCESS
+# =====================================================
+async def crawl_all_posts():
+    # Cùng index với pipeline RAG (post_id, created_time, _id): load_known_comment_ids không quét
+    # cả collection, và 2 bên dùng chung 1 index thay vì tạo 2
+    await asyncio.to_thread(
+        comments_col.create_index, [("post_id", 1), ("created_time", 1), ("_id", 1)]
+    )
+    posts = await asyncio.to_thread(
+        lambda: list(posts_col.find({}, {"_id": 1, "permalink_url": 1}))
+    )
+    request_slots = asyncio.Semaphore(REQUEST_CONCURRENCY)
+    pending = iter(posts)
+    total = 0
+
+    async def worker(session):
+        # POST_CONCURRENCY worker lấy lần lượt post tiếp theo (không tạo 1 task / post)
+        nonlocal total
+        for post in pending:
+            saved = await crawl_post(session, request_slots, writer, post)
+            total += saved
+
+    connector = aiohttp.TCPConnector(limit=REQUEST_CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(total=60)
+    writer = BulkWriter(comments_col)
+    try:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            await asyncio.gather(*(worker(session) for _ in range(POST_CONCURRENCY)))
+    finally:
+        # Exception giữa chừng: vẫn ghi các comment đã gom trong buffer
+        await asyncio.to_thread(writer.close)
+
+    print(f"\nSaved {total} new root comments across {len(posts)} posts")
+    print(f"   ➜ Graph API usage {LIMITER.usage:.0f}%, throttled {LIMITER.throttled} times")
 
-        for c in new_comments:
-            comments_col.update_one(
-                {"_id": c["_id"]},
-                {"$set": c},
-                upsert=True
-            )
-
-            # =============================
-            # REPLIES
-            # =============================
-            replies = get_replies(c["_id"], post_id, permalink)
-            for r in replies:
-                comments_col.update_one(
-                    {"_id": r["_id"]},
-                    {"$set": r},
-                    upsert=True
-                )
-
-            time.sleep(0.3)
-
-        print(f"   ➜ Saved {len(new_comments)} new root comments")
-        time.sleep(1)
+
+if __name__ == "__main__":
+    asyncio.run(crawl_all_posts())
 
     print("\nDONE. Incremental comment crawl finished.")
@@ -1,9 +1,12 @@
 import os
-import time
+import json
 import requests
+from urllib.parse import quote
 from datetime import datetime
 from pymongo import MongoClient
 from dotenv import load_dotenv
+from mongo_writer import BulkWriter, find_existing_ids
+from rate_limiter import RateLimiter, request_json
 
 # =====================================================
 # LOAD ENV
@@ -23,6 +26,15 @@ if not ACCESS_TOKEN:
 
 BASE_URL = f"https://graph.facebook.com/{GRAPH_VERSION}"
 REACTION_TYPES = ["LIKE", "LOVE", "HAHA", "WOW", "SAD", "ANGRY"]
+# Mỗi loại reaction là 1 field alias (reactions_like, ...): đếm luôn trong request feed,
+# không gọi API riêng cho từng post x từng loại
+REACTION_FIELDS = ",".join(
+    f"reactions.type({r}).limit(0).summary(total_count).as(reactions_{r.lower()})"
+    for r in REACTION_TYPES
+)
+GRAPH_BATCH_SIZE = 50  # Graph API: tối đa 50 request trong 1 batch
+# Giãn request theo quota (header usage của Graph API), bị throttle thì backoff rồi gửi lại
+LIMITER = RateLimiter()
 
 # =====================================================
 # MONGODB
@@ -47,24 +59,24 @@ def get_new_posts():
             "created_time,"
             "updated_time,"
             "comments.summary(true),"
-            "shares"
+            "shares,"
+            + REACTION_FIELDS
         ),
         "limit": 10,          # an toàn cho group
         "access_token": ACCESS_TOKEN
     }
 
     while url:
-        res = requests.get(url, params=params)
-        data = res.json()
+        data = request_json(LIMITER, lambda: requests.get(url, params=params))
 
-        if "error" in data:
-            raise Exception(data["error"])
-
-        for post in data.get("data", []):
+        page = data.get("data", [])
+        # 1 query $in cho cả page thay vì find_one từng post
+        known = find_existing_ids(posts_col, [p["id"] for p in page])
+        for post in page:
             post_id = post["id"]
 
             # DỪNG KHI GẶP POST CŨ
-            if posts_col.find_one({"_id": post_id}):
+            if post_id in known:
                 print(f"Reached old post {post_id}. Stop crawling.")
                 return new_posts
 
@@ -72,28 +84,59 @@ def get_new_posts():
 
         url = data.get("paging", {}).get("next")
         params = None
-        time.sleep(1)   # tránh bị drop bài
 
     return new_posts
 
 # =====================================================
-# GET REACTION COUNT
+# REACTIONS
 # =====================================================
-def get_reaction_count(post_id, reaction_type):
-    url = f"{BASE_URL}/{post_id}"
-    params = {
-        "fields": f"reactions.type({reaction_type}).summary(true)",
-        "access_token": ACCESS_TOKEN
-    }
-
-    res = requests.get(url, params=params)
-    data = res.json()
-
-    return (
-        data.get("reactions", {})
-            .get("summary", {})
-            .get("total_count", 0)
-    )
+def parse_reactions(post):
+    """{"LIKE": n, ...} từ các field alias của post; None nếu response không có alias."""
+    reactions = {}
+    for r in REACTION_TYPES:
+        field = post.get(f"reactions_{r.lower()}")
+        if field is None:
+            return None
+        reactions[r] = field.get("summary", {}).get("total_count", 0)
+    return reactions
+
+
+def get_reactions_batch(post_ids):
+    """
+    Reactions của nhiều post qua Graph batch request (GRAPH_BATCH_SIZE post / lần gọi).
+    Dùng khi feed không trả về field alias; post lỗi (hoặc cả batch lỗi) thì đếm 0 như trước.
+    """
+    zeros = {r: 0 for r in REACTION_TYPES}
+    result = {}
+    for i in range(0, len(post_ids), GRAPH_BATCH_SIZE):
+        chunk = post_ids[i:i + GRAPH_BATCH_SIZE]
+        batch = [
+            {"method": "GET", "relative_url": f"{post_id}?fields={quote(REACTION_FIELDS)}"}
+            for post_id in chunk
+        ]
+        try:
+            data = request_json(LIMITER, lambda: requests.post(
+                f"{BASE_URL}/",
+                data={
+                    "batch": json.dumps(batch),
+                    "include_headers": "false",
+                    "access_token": ACCESS_TOKEN
+                }
+            ))
+        except Exception as e:
+            # 1 batch lỗi không làm hỏng cả lần crawl: các post của batch đếm 0
+            print(f"⚠️  Failed to get reactions for {len(chunk)} posts: {str(e)}")
+            data = []
+        if not isinstance(data, list):
+            data = []
+
+        for post_id, item in zip(chunk, data):
+            body = {}
+            if item and item.get("code") == 200:
+                body = json.loads(item.get("body") or "{}")
+            result[post_id] = parse_reactions(body) or dict(zeros)
+
+    return result
 
 # =====================================================
 # MAIN
@@ -102,48 +145,51 @@ if __name__ == "__main__":
     new_posts = get_new_posts()
     print(f"\nFound {len(new_posts)} new posts\n")
 
-    for post in new_posts:
-        post_id = post["id"]
+    # Reactions đã có trong response feed (field alias); chỉ post thiếu mới gọi batch
+    missing = [p["id"] for p in new_posts if parse_reactions(p) is None]
+    batch_reactions = get_reactions_batch(missing) if missing else {}
+
+    writer = BulkWriter(posts_col)
+    try:
+        # Post cũ trước, mới sau: dừng giữa chừng thì lần chạy sau không dừng sớm ở post mới
+        # mà bỏ sót các post cũ hơn chưa ghi
+        for post in reversed(new_posts):
+            post_id = post["id"]
 
-        author = post.get("from")
-        author_data = None
-        if author:
-            author_data = {
-                "id": author.get("id"),
-                "name": author.get("name")
+            author = post.get("from")
+            author_data = None
+            if author:
+                author_data = {
+                    "id": author.get("id"),
+                    "name": author.get("name")
+                }
+
+            reactions = parse_reactions(post) or batch_reactions.get(post_id, {r: 0 for r in REACTION_TYPES})
+
+            document = {
+                "_id": post_id,
+                "group_id": GROUP_ID,
+                "permalink_url": post.get("permalink_url"),
+                "author": author_data,
+                "message": post.get("message"),
+                "created_time": post.get("created_time"),
+                "updated_time": post.get("updated_time"),
+                "full_picture": post.get("full_picture"),
+                "comments_count": (
+                    post.get("comments", {})
+                        .get("summary", {})
+                        .get("total_count", 0)
+                ),
+                "shares_count": post.get("shares", {}).get("count", 0),
+                "reactions": reactions,
+                "fetched_at": datetime.utcnow()
             }
 
-        reactions = {}
-        for r in REACTION_TYPES:
-            reactions[r] = get_reaction_count(post_id, r)
-            time.sleep(0.3)
-
-        document = {
-            "_id": post_id,
-            "group_id": GROUP_ID,
-            "permalink_url": post.get("permalink_url"),
-            "author": author_data,
-            "message": post.get("message"),
-            "created_time": post.get("created_time"),
-            "updated_time": post.get("updated_time"),
-            "full_picture": post.get("full_picture"),
-            "comments_count": (
-                post.get("comments", {})
-                    .get("summary", {})
-                    .get("total_count", 0)
-            ),
-            "shares_count": post.get("shares", {}).get("count", 0),
-            "reactions": reactions,
-            "fetched_at": datetime.utcnow()
-        }
-
-        posts_col.update_one(
-            {"_id": post_id},
-            {"$set": document},
-            upsert=True
-        )
-
-        print(f"Saved post {post_id}")
-        time.sleep(0.5)
+            writer.add(document)
+            print(f"Saved post {post_id}")
+    finally:
+        # Exception giữa chừng: vẫn ghi các post đã gom trong buffer
+        writer.close()
+    print(f"   ➜ Graph API usage {LIMITER.usage:.0f}%, throttled {LIMITER.throttled} times")
 
     print("\nDONE.")
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+
+# =====================================================
+# ADAPTIVE RATE LIMIT (dùng chung cho nckhgetposts.py / nckhgetcmt.py)
+# =====================================================
+# Tốc độ request / giây: tối đa khi quota còn nhiều, giảm dần về MIN_RATE khi usage tăng
+MAX_RATE = float(os.getenv("CRAWL_MAX_RATE", "5"))
+MIN_RATE = 0.2
+BURST = 5              # số request được phép dồn liền nhau
+USAGE_LOW = 50         # usage (%) dưới mức này: chạy MAX_RATE
+USAGE_HIGH = 90        # từ mức này trở lên: chạy MIN_RATE
+
+# Lỗi throttle của Graph API: 4 (app), 17 (user), 32 (page), 613 (custom), 8000x (business use case)
+THROTTLE_CODES = {4, 17, 32, 613, 80001, 80002, 80003, 80004, 80005, 80006, 80008, 80009, 80014}
+RETRY_STATUS = {429, 500, 502, 503, 504}
+MAX_RETRIES = 6
+BACKOFF_BASE = 2.0     # giây, nhân đôi mỗi lần retry
+BACKOFF_MAX = 300.0
+
+
+class RateLimiter:
+    """
+    Token bucket dùng chung cho mọi request của 1 lần crawl (thread-safe).
+
+    Tốc độ nạp token chỉnh theo header X-App-Usage / X-Business-Use-Case-Usage của
+    response gần nhất; bị throttle thì mọi request cùng dừng tới hết thời gian backoff.
+    """
+
+    def __init__(self, max_rate=MAX_RATE, min_rate=MIN_RATE, burst=BURST):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.rate = max_rate
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.usage = 0.0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def _reserve(self):
+        """Giữ chỗ 1 token, trả về số giây phải chờ trước khi gửi request."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def update(self, headers):
+        """Chỉnh tốc độ theo usage (%) cao nhất trong các header usage của response."""
+        usage, regain_minutes = parse_usage(headers)
+        if usage is None:
+            return
+        with self.lock:
+            self.usage = usage
+            if usage <= USAGE_LOW:
+                self.rate = self.max_rate
+            elif usage >= USAGE_HIGH:
+                self.rate = self.min_rate
+            else:
+                ratio = (USAGE_HIGH - usage) / (USAGE_HIGH - USAGE_LOW)
+                self.rate = self.min_rate + (self.max_rate - self.min_rate) * ratio
+            if regain_minutes:
+                # Facebook báo thời gian bị chặn: chờ hết thay vì gửi request chắc chắn lỗi
+                self.paused_until = max(self.paused_until, time.monotonic() + regain_minutes * 60)
+
+    def backoff(self, attempt):
+        """Bị throttle: dừng cả limiter theo backoff mũ + jitter, trả về số giây chờ."""
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        with self.lock:
+            self.throttled += 1
+            self.rate = self.min_rate
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        return delay
+
+
+def parse_usage(headers):
+    """(usage % cao nhất, số phút tới khi hết bị chặn) từ header; usage None nếu không có header."""
+    values = []
+    regain = 0
+    app_usage = headers.get("X-App-Usage")
+    if app_usage:
+        try:
+            values.extend(json.loads(app_usage).values())
+        except ValueError:
+            pass
+    buc_usage = headers.get("X-Business-Use-Case-Usage")
+    if buc_usage:
+        try:
+            for entries in json.loads(buc_usage).values():
+                for entry in entries:
+                    values.extend(
+                        entry.get(k, 0) for k in ("call_count", "total_cputime", "total_time")
+                    )
+                    regain = max(regain, entry.get("estimated_time_to_regain_access", 0) or 0)
+        except (ValueError, AttributeError):
+            pass
+    numbers = [float(v) for v in values if isinstance(v, (int, float))]
+    if not numbers:
+        return None, regain
+    return max(numbers), regain
+
+
+def is_throttled(error):
+    return error.get("code") in THROTTLE_CODES or bool(error.get("is_transient"))
+
+# =====================================================
+# REQUEST + RETRY
+# =====================================================
+def _retryable(status, data):
+    if data is None:
+        return status in RETRY_STATUS
+    return isinstance(data, dict) and "error" in data and is_throttled(data["error"])
+
+
+def _reason(status, data):
+    if data is None:
+        return f"HTTP {status}"
+    return f"error code {data['error'].get('code')}"
+
+
+def _check(data):
+    if isinstance(data, dict) and "error" in data:
+        raise Exception(data["error"])
+    return data
+
+
+def request_json(limiter, send):
+    """
+    Gửi request (requests) qua limiter: `send()` trả về response.
+    Throttle / lỗi tạm thời thì backoff rồi gửi lại (tối đa MAX_RETRIES lần).
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire()
+        res = send()
+        limiter.update(res.headers)
+        try:
+            data = res.json()
+        except ValueError:
+            data = None
+
+        if attempt < MAX_RETRIES and _retryable(res.status_code, data):
+            delay = limiter.backoff(attempt)
+            print(f"⏳ Throttled ({_reason(res.status_code, data)}), retry in {delay:.1f}s")
+            continue
+        if data is None:
+            raise Exception(f"HTTP {res.status_code}: invalid JSON response")
+        return _check(data)
+
+
+async def request_json_async(limiter, send):
+    """Như request_json, với `send()` trả về request aiohttp (dùng trong `async with`)."""
+    for attempt in range(MAX_RETRIES + 1):
+        await limiter.acquire_async()
+        async with send() as resp:
+            limiter.update(resp.headers)
+            try:
+                data = await resp.json(content_type=None)
+            except ValueError:
+                data = None
+            status = resp.status
+
+        if attempt < MAX_RETRIES and _retryable(status, data):
+            delay = limiter.backoff(attempt)
+            print(f"⏳ Throttled ({_reason(status, data)}), retry in {delay:.1f}s")
+            continue
+        if data is None:
+            raise Exception(f"HTTP {status}: invalid JSON response")
+        return _check(data)
@@ -35,6 +35,11 @@ model: Any | None = None
 
 # Configuration
 MIN_SCORE_THRESHOLD = 0.3
+# Micro-batching query encoder: gom các request /api/chat đồng thời thành 1 lần encode BGE-M3
+ENCODE_BATCH_SIZE = int(os.environ.get("RAG_ENCODE_BATCH_SIZE", "16"))
+ENCODE_BATCH_WAIT_MS = float(os.environ.get("RAG_ENCODE_BATCH_WAIT_MS", "5"))
+# Chu kỳ poll Qdrant để nạp dữ liệu mới crawl mà không restart (mặc định 0 = tắt, vẫn gọi được /api/refresh)
+REFRESH_INTERVAL_S = float(os.environ.get("RAG_REFRESH_INTERVAL_S", "0"))
 
 
 class ChatRequest(BaseModel):
@@ -60,7 +65,12 @@ def get_retriever():
     """Initialize and return RAGRetriever instance (singleton)."""
     global retriever
     if retriever is None:
-        retriever = RAGRetriever(use_hybrid=True)
+        retriever = RAGRetriever(
+            use_hybrid=True,
+            batch_max_size=ENCODE_BATCH_SIZE,
+            batch_max_wait_ms=ENCODE_BATCH_WAIT_MS,
+            refresh_interval_s=REFRESH_INTERVAL_S,
+        )
     return retriever
 
 
@@ -89,6 +99,7 @@ async def root() -> Dict[str, Any]:
             "GET /": "API information (this endpoint)",
             "GET /api/health": "Health check",
             "POST /api/chat": "Chat endpoint - requires JSON: {\"question\": \"your question\"}",
+            "POST /api/refresh": "Load points added/changed in Qdrant since the last sync",
         },
     }
 
@@ -102,11 +113,33 @@ async def health_check() -> Dict[str, str]:
     }
 
 
+@app.post("/api/refresh")
+def refresh() -> Dict[str, Any]:
+    """
+    Pull new/changed points into the retriever caches without restarting.
+
+    Meant to be called by the indexing pipeline after it finishes; the periodic
+    poll (RAG_REFRESH_INTERVAL_S > 0, off by default) does the same thing on a timer.
+    """
+    try:
+        applied = get_retriever().refresh()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Refresh failed: {e}")
+    return {
+        "success": True,
+        "applied": applied,
+        "full_reload": applied < 0,
+    }
+
+
 @app.post("/api/chat")
-async def chat(request: ChatRequest) -> Dict[str, Any]:
+def chat(request: ChatRequest) -> Dict[str, Any]:
     """
     Chat endpoint that processes user questions using RAG.
 
+    Sync handler: FastAPI runs it in its threadpool, so concurrent requests reach
+    the retriever together and get encoded in one micro-batch.
+
     Request body:
         {
             "question": "string"  # User's question
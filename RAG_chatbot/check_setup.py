@@ -93,6 +93,7 @@ def check_mongodb():
     
     try:
         from src.utils.config import get_mongo_client, MONGO_DB_SOURCE, get_qdrant_client, QDRANT_COLLECTION_NAME
+        from src.utils.vectors import dense_vector
         
         # Kiểm tra MongoDB (dữ liệu nguồn)
         client = get_mongo_client()
@@ -131,7 +132,9 @@ def check_mongodb():
             )
             
             if points_sample:
-                embedded_count = sum(1 for p in points_sample if p.vector and sum(p.vector) != 0)
+                # Collection mới: vector có tên ({"dense": ..., "sparse": ...})
+                dense_sample = [dense_vector(p.vector) for p in points_sample]
+                embedded_count = sum(1 for v in dense_sample if v and sum(v) != 0)
                 estimated_embedded = int((embedded_count / len(points_sample)) * total_points)
                 print(f"     - Points có embeddings: ~{estimated_embedded}/{total_points} (estimated)")
                 
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark dense scoring + top-k selection of RAGRetriever on synthetic vectors.
+
+So sánh:
+  - legacy: chuẩn hóa lại toàn bộ ma trận mỗi query + np.argsort trên mọi doc
+  - current: ma trận đã chuẩn hóa lúc load (float32/float16) + argpartition top-k
+  - ann (--ann): IVF index (src/rag/ann_index.py) + recall@k so với brute force
+
+Usage:
+    python scripts/bench_retrieval.py                      # 100k và 1M vectors, dim 1024
+    python scripts/bench_retrieval.py --sizes 100000 --dtype float16
+    python scripts/bench_retrieval.py --sizes 100000 --ann --nprobe 16
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.rag.ann_index import IVFIndex  # noqa: E402
+from src.rag.retriever import _dense_scores, _normalize_rows, _top_k_indices  # noqa: E402
+
+
+def _legacy_query(embeddings: np.ndarray, q_vec: np.ndarray, k: int) -> np.ndarray:
+    """Per-query path before pre-normalization (re-normalize all rows, full argsort)."""
+    a = q_vec[None, :]
+    a_norm = a / (np.linalg.norm(a, axis=1, keepdims=True) + 1e-8)
+    b_norm = embeddings / (np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-8)
+    scores = np.dot(a_norm, b_norm.T)[0]
+    return np.argsort(-scores)[:k]
+
+
+def _current_query(normed: np.ndarray, q_vec: np.ndarray, k: int) -> np.ndarray:
+    scores = _dense_scores(normed, q_vec)
+    return _top_k_indices(scores, k)
+
+
+def _time_per_query(fn, queries: np.ndarray) -> float:
+    fn(queries[0])  # warm-up
+    start = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - start) / len(queries) * 1000.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=20, help="top_k * overfetch của retriever")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--skip-legacy", action="store_true", help="Bỏ qua legacy (tốn ~3x RAM ma trận)")
+    parser.add_argument("--ann", action="store_true", help="Đo thêm IVF index (build time, ms/q, recall@k)")
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--ann-candidates", type=int, default=512)
+    parser.add_argument("--clusters", type=int, default=256, help="Dữ liệu tổng hợp dạng cụm (0 = gaussian thuần)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((max(1, args.clusters), args.dim)).astype(np.float32)
+
+    def sample(count: int) -> np.ndarray:
+        # Embedding thật có cấu trúc cụm; gaussian thuần là trường hợp xấu nhất cho IVF
+        noise = rng.standard_normal((count, args.dim), dtype=np.float32)
+        if args.clusters <= 0:
+            return noise
+        return centers[rng.integers(len(centers), size=count)] + 0.8 * noise
+
+    queries = sample(args.queries)
+
+    print(f"dim={args.dim} queries={args.queries} k={args.top_k} dtype={args.dtype}")
+    print(f"{'N':>10} {'legacy ms/q':>12} {'current ms/q':>13} {'speedup':>8} {'same top-k':>10}")
+    for n in args.sizes:
+        raw = None if args.skip_legacy else np.empty((n, args.dim), dtype=np.float32)
+        normed = np.empty((n, args.dim), dtype=args.dtype)
+        for start in range(0, n, 100_000):
+            chunk = sample(min(100_000, n - start))
+            normed[start : start + len(chunk)] = _normalize_rows(chunk, args.dtype)
+            if raw is not None:
+                raw[start : start + len(chunk)] = chunk
+
+        current_ms = _time_per_query(lambda q: _current_query(normed, q, args.top_k), queries)
+        if args.skip_legacy:
+            print(f"{n:>10} {'-':>12} {current_ms:>13.2f} {'-':>8} {'-':>10}")
+        else:
+            legacy_ms = _time_per_query(lambda q: _legacy_query(raw, q, args.top_k), queries)
+            same = all(
+                set(_legacy_query(raw, q, args.top_k)) == set(_current_query(normed, q, args.top_k))
+                for q in queries[:3]
+            )
+            print(f"{n:>10} {legacy_ms:>12.2f} {current_ms:>13.2f} {legacy_ms / current_ms:>7.1f}x {str(same):>10}")
+        del raw
+
+        if args.ann:
+            start = time.perf_counter()
+            ivf = IVFIndex.build(normed)
+            build_s = time.perf_counter() - start
+            q_norm = _normalize_rows(queries)
+            ann_ms = _time_per_query(
+                lambda q: ivf.search(normed, q, args.ann_candidates, args.nprobe), q_norm
+            )
+            recall = ivf.recall_at_k(normed, q_norm, args.top_k, args.nprobe, args.ann_candidates)
+            print(
+                f"{'':>10} ann: {ivf.n_lists} lists nprobe={args.nprobe} build={build_s:.1f}s "
+                f"{ann_ms:.2f} ms/q ({current_ms / ann_ms:.1f}x vs current) recall@{args.top_k}={recall:.3f}"
+            )
+        del normed
+
+
+if __name__ == "__main__":
+    main()
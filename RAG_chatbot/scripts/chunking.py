@@ -0,0 +1,93 @@
+"""Split long documents into overlapping token windows, used by pipeline.py."""
+
+from typing import Any, Dict, List, Optional
+
+from config import chunk_doc_id
+
+# Cửa sổ token của 1 chunk và phần gối lên chunk trước (token của tokenizer BGE-M3)
+CHUNK_MAX_TOKENS = 512
+CHUNK_OVERLAP_TOKENS = 64
+
+# Chỉ chia chunk các loại document có thể dài tùy ý
+CHUNKED_TYPES = ("post", "thread_summary")
+
+
+class Chunker:
+    """
+    Token-window chunker on the embedding model's tokenizer.
+
+    A text longer than ``max_tokens`` becomes windows of ``max_tokens`` tokens, each
+    starting ``max_tokens - overlap`` tokens after the previous one, cut on word
+    boundaries. Windows are taken from the start of the text, so appending to it (a
+    thread getting new comments) only changes the last chunks.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        max_tokens: int = CHUNK_MAX_TOKENS,
+        overlap: int = CHUNK_OVERLAP_TOKENS,
+        tokenizer: Optional[Any] = None,
+    ) -> None:
+        if not 0 <= overlap < max_tokens:
+            raise ValueError("overlap must be in [0, max_tokens)")
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self._tokenizer = tokenizer
+        self.n_chunked = 0
+
+    @property
+    def tokenizer(self) -> Any:
+        if self._tokenizer is None:
+            # Chỉ tokenizer (không load model): document ngắn thì không bao giờ cần tới
+            from transformers import AutoTokenizer
+
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        return self._tokenizer
+
+    def split(self, text: str) -> List[str]:
+        """``text`` as overlapping windows (a single element if it fits)."""
+        # Mỗi token ít nhất 1 ký tự: text ngắn hơn max_tokens ký tự thì không cần tokenize
+        if len(text) <= self.max_tokens:
+            return [text]
+        offsets = self.tokenizer(
+            text, add_special_tokens=False, return_offsets_mapping=True
+        )["offset_mapping"]
+        if len(offsets) <= self.max_tokens:
+            return [text]
+
+        chunks: List[str] = []
+        step = self.max_tokens - self.overlap
+        for first in range(0, len(offsets), step):
+            last = min(first + self.max_tokens, len(offsets)) - 1
+            start, end = offsets[first][0], offsets[last][1]
+            # Không cắt giữa từ
+            while start > 0 and not text[start - 1].isspace():
+                start -= 1
+            while end < len(text) and not text[end].isspace():
+                end += 1
+            chunks.append(text[start:end].strip())
+            if last == len(offsets) - 1:
+                break
+        return chunks
+
+    def split_document(self, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Payloads of the document's chunks: the first keeps ``doc_id``, the others get
+        ``<doc_id>#<i>``; all keep ``source`` (post_id) and carry ``chunk`` = parent + index.
+        The first also carries ``full_text``, returned by retrieval instead of a single chunk.
+        """
+        if payload.get("type") not in CHUNKED_TYPES:
+            return [payload]
+        parts = self.split(payload["text"])
+        if len(parts) == 1:
+            return [payload]
+        self.n_chunked += 1
+        doc_id = payload["doc_id"]
+        chunks = [
+            dict(payload, doc_id=chunk_doc_id(doc_id, i), text=part, chunk={"parent": doc_id, "index": i})
+            for i, part in enumerate(parts)
+        ]
+        chunks[0]["full_text"] = payload["text"]
+        return chunks
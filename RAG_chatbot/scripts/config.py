@@ -18,6 +18,22 @@ from src.utils.config import (  # noqa: E402, F401
     QDRANT_URL,
     QDRANT_KEY,
     QDRANT_COLLECTION_NAME,
+    PIPELINE_STATE_DIR,
     get_mongo_client,
     get_qdrant_client,
 )
+from src.utils.collection_meta import (  # noqa: E402, F401
+    COLLECTION_META_TYPE,
+    bump_collection_version,
+    chunk_doc_id,
+    doc_point_id,
+)
+from src.utils.vectors import (  # noqa: E402, F401
+    DENSE_VECTOR_NAME,
+    SPARSE_VECTOR_NAME,
+    create_named_collection,
+    dense_vector,
+    point_vector,
+    sparse_vector,
+    uses_named_vectors,
+)
@@ -0,0 +1,87 @@
+"""Persistent (model, text) -> BGE-M3 outputs cache (SQLite), shared by the pipeline passes."""
+
+import hashlib
+import json
+import sqlite3
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+# SQLite cũ giới hạn 999 tham số / câu lệnh
+_MAX_VARS = 500
+
+Entry = Tuple[np.ndarray, Optional[Dict[int, float]]]
+
+
+def normalize_text(text: str) -> str:
+    """
+    Text as encoded and as keyed in the cache: NFC + stripped.
+
+    The BGE-M3 tokenizer already NFKC-normalizes, so this never changes the embedding,
+    only lets equivalent spellings share one entry.
+    """
+    return unicodedata.normalize("NFC", text or "").strip()
+
+
+class EmbeddingCache:
+    """
+    ``sha1(model, text) -> (dense float32, sparse dict or NULL)`` in one SQLite file.
+
+    A sparse-less entry (written while sparse was off) counts as a miss for lookups
+    that need sparse; the re-encoded entry then replaces it.
+    """
+
+    def __init__(self, path: Union[str, Path], model: str) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.model = model
+        # timeout: các worker của embed_pending(workers=N) ghi chung một file
+        self._conn = sqlite3.connect(str(self.path), timeout=60)
+        # WAL: đọc không bị chặn khi đang ghi, ghi batch nhanh hơn
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key BLOB PRIMARY KEY, dense BLOB NOT NULL, sparse TEXT"
+            ") WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def key(self, text: str) -> bytes:
+        """Cache key of an already-normalized text."""
+        return hashlib.sha1(f"{self.model}\0{text}".encode("utf-8")).digest()
+
+    def get_many(self, keys: List[bytes], with_sparse: bool = False) -> Dict[bytes, Entry]:
+        """Entries found for ``keys`` (missing / sparse-less when ``with_sparse`` are left out)."""
+        found: Dict[bytes, Entry] = {}
+        for i in range(0, len(keys), _MAX_VARS):
+            chunk = keys[i : i + _MAX_VARS]
+            rows = self._conn.execute(
+                f"SELECT key, dense, sparse FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            for key, dense, sparse in rows:
+                if with_sparse and sparse is None:
+                    continue
+                weights = {int(k): float(v) for k, v in json.loads(sparse).items()} if sparse is not None else None
+                found[bytes(key)] = (np.frombuffer(dense, dtype=np.float32), weights)
+        return found
+
+    def put_many(self, entries: Iterable[Tuple[bytes, np.ndarray, Optional[Dict[int, float]]]]) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, dense, sparse) VALUES (?, ?, ?)",
+            (
+                (
+                    key,
+                    np.asarray(dense, dtype=np.float32).tobytes(),
+                    json.dumps(sparse) if sparse is not None else None,
+                )
+                for key, dense, sparse in entries
+            ),
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
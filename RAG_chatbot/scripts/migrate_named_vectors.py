@@ -0,0 +1,135 @@
+"""
+Migrate a legacy knowledge base collection to the named dense + sparse vector layout.
+
+Legacy collections store one unnamed dense vector per point and the BGE-M3 sparse
+weights as a JSON dict in the payload (``sparse_embedding``). The named layout keeps
+them as a ``dense`` vector and a native Qdrant ``sparse`` vector, so the payload stays
+small and hybrid retrieval reads the weights as arrays. Vectors are copied as is:
+nothing is re-encoded.
+
+Usage:
+    python scripts/migrate_named_vectors.py                  # copy into <collection>_named
+    python scripts/migrate_named_vectors.py --replace        # convert the collection in place
+    python scripts/migrate_named_vectors.py --force          # overwrite an existing target
+"""
+
+import argparse
+from typing import Any, Dict, List, Optional
+
+from qdrant_client.http.models import PointStruct
+
+from config import (
+    QDRANT_COLLECTION_NAME,
+    bump_collection_version,
+    dense_vector,
+    get_qdrant_client,
+    point_vector,
+    sparse_vector,
+    uses_named_vectors,
+)
+from pipeline import SCROLL_PAGE_SIZE, _zero_vector, ensure_collection
+from src.rag.sparse_index import clean_sparse_weights
+
+
+def _sparse_weights(point: Any, payload: Dict[str, Any]) -> Optional[Dict[int, float]]:
+    native = sparse_vector(point.vector)
+    if native is not None:
+        return {int(i): float(v) for i, v in zip(native.indices, native.values)}
+    # Layout cũ: sparse nằm trong payload (key là string sau khi lưu JSON)
+    weights = clean_sparse_weights(payload.pop("sparse_embedding", None))
+    return weights or None
+
+
+def copy_points(qdrant_client, source: str, target: str) -> int:
+    """Copy every point of ``source`` into the named collection ``target``; returns the count."""
+    n_copied = 0
+    offset = None
+    while True:
+        points, offset = qdrant_client.scroll(
+            collection_name=source,
+            limit=SCROLL_PAGE_SIZE,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        batch: List[PointStruct] = []
+        for p in points:
+            payload = dict(p.payload or {})
+            dense = dense_vector(p.vector)
+            if dense is None:
+                continue
+            sparse = _sparse_weights(p, payload)
+            if sparse:
+                payload["has_sparse"] = True
+            batch.append(PointStruct(id=p.id, vector=point_vector(True, list(dense), sparse), payload=payload))
+        if batch:
+            qdrant_client.upsert(collection_name=target, points=batch, wait=True)
+            n_copied += len(batch)
+            print(f"Copied {n_copied} points: '{source}' -> '{target}'")
+        if not points or offset is None:
+            return n_copied
+
+
+def migrate_collection(
+    source: Optional[str] = None,
+    target: Optional[str] = None,
+    replace: bool = False,
+    force: bool = False,
+) -> int:
+    """
+    Copy ``source`` (default: QDRANT_COLLECTION_NAME) into the named layout.
+
+    Without ``replace`` the copy goes to ``target`` (default ``<source>_named``) and the
+    source is left untouched; point QDRANT_COLLECTION_NAME at it once checked. With
+    ``replace`` the source is rebuilt in place through a temporary copy (the collection
+    is unavailable between the delete and the copy back). An existing ``target`` is only
+    overwritten with ``force``. Returns the number of points.
+    """
+    if source is None:
+        source = QDRANT_COLLECTION_NAME
+    qdrant_client = get_qdrant_client()
+    existing = {c.name for c in qdrant_client.get_collections().collections}
+    if source not in existing:
+        print(f"Collection '{source}' not found in Qdrant.")
+        return 0
+    if uses_named_vectors(qdrant_client, source):
+        print(f"Collection '{source}' already uses named dense + sparse vectors. Nothing to do.")
+        return 0
+
+    if target is None:
+        target = f"{source}_named"
+    if target == source:
+        print(f"Target '{target}' is the source collection. Use --replace to convert it in place.")
+        return 0
+    if target in existing:
+        if not force:
+            print(f"Collection '{target}' already exists. Pass --force to overwrite it.")
+            return 0
+        # Bản copy phải mới hoàn toàn: collection cũ trùng tên (lần chạy dở) thì tạo lại
+        qdrant_client.delete_collection(target)
+    ensure_collection(qdrant_client, target)
+    n_copied = copy_points(qdrant_client, source, target)
+
+    if replace:
+        qdrant_client.delete_collection(source)
+        ensure_collection(qdrant_client, source)
+        copy_points(qdrant_client, target, source)
+        qdrant_client.delete_collection(target)
+        target = source
+
+    # Đổi version: retriever bỏ snapshot mmap cũ và load lại theo layout mới
+    bump_collection_version(qdrant_client, target, _zero_vector(True))
+    print(f"Migrated {n_copied} points into '{target}' (named dense + sparse vectors).")
+    if target != source:
+        print(f"Set QDRANT_COLLECTION_NAME={target} in .env, then delete '{source}' when no longer needed.")
+    return n_copied
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", default=None, help="source collection (default: QDRANT_COLLECTION_NAME)")
+    parser.add_argument("--target", default=None, help="target collection (default: <collection>_named)")
+    parser.add_argument("--replace", action="store_true", help="convert the source collection in place")
+    parser.add_argument("--force", action="store_true", help="delete and recreate the target if it already exists")
+    args = parser.parse_args()
+    migrate_collection(args.collection, args.target, replace=args.replace, force=args.force)
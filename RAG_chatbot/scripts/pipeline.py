@@ -0,0 +1,880 @@
+"""
+Knowledge base pipeline: MongoDB posts/comments -> documents -> BGE-M3 embeddings -> Qdrant.
+
+Documents are streamed from Mongo, embedded and written with one upsert per batch, so
+no point is ever stored with a placeholder vector. ``index_mongo.py`` and
+``embed_bge_m3.py`` are thin wrappers over ``run_pipeline`` / ``embed_pending``.
+"""
+
+import hashlib
+import json
+import os
+import time
+from array import array
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from FlagEmbedding import BGEM3FlagModel
+from pymongo import ASCENDING
+from qdrant_client.http.models import PointStruct, PointIdsList, PayloadSchemaType
+
+from config import (
+    COLLECTION_META_TYPE,
+    MONGO_DB_SOURCE,
+    PIPELINE_STATE_DIR,
+    QDRANT_COLLECTION_NAME,
+    bump_collection_version,
+    create_named_collection,
+    doc_point_id,
+    get_mongo_client,
+    get_qdrant_client,
+    point_vector,
+    uses_named_vectors,
+)
+from chunking import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, Chunker
+from embedding_cache import EmbeddingCache, Entry, normalize_text
+from shards import id_key, report_progress, run_shards, shard_bounds
+from stages import StageStats, bottleneck, run_stages
+
+EMBEDDING_MODEL = "BAAI/bge-m3"
+EMBEDDING_DIM = 1024
+
+# Batch của BGE-M3: text được sort theo số token, mỗi batch tối đa ENCODE_TOKEN_BUDGET token
+# sau padding (= số text x độ dài text dài nhất) và tối đa ENCODE_BATCH_SIZE text.
+# token_budget <= 0: batch cố định ENCODE_BATCH_SIZE text theo thứ tự gốc (cách cũ, để so sánh)
+ENCODE_TOKEN_BUDGET = 8192
+ENCODE_BATCH_SIZE = 64
+ENCODE_MAX_LENGTH = 8192  # giới hạn token của BGE-M3
+
+# Số point mỗi lần upsert / set_payload / delete (tránh WriteTimeout, giới hạn RAM)
+WRITE_BATCH_SIZE = 256
+
+# Đọc / encode / upload chạy chồng lên nhau: tối đa STAGE_QUEUE_SIZE batch đã đọc chờ encode,
+# UPLOAD_WORKERS luồng upsert song song
+STAGE_QUEUE_SIZE = 2
+UPLOAD_WORKERS = 2
+
+# Cache embedding theo (model, text), dùng chung cho mọi collection
+EMBEDDING_CACHE_FILE = "embedding_cache.sqlite3"
+
+# Số point mỗi trang scroll của embed_pending (1 checkpoint / trang)
+SCROLL_PAGE_SIZE = 256
+
+# Projection: chỉ đọc các field dùng để build document
+POST_FIELDS = {"message": 1, "permalink_url": 1, "created_time": 1, "fetched_at": 1}
+COMMENT_FIELDS = {"post_id": 1, "message": 1, "permalink_url": 1, "created_time": 1, "fetched_at": 1}
+
+
+def _str_or_none(value: Any) -> Optional[str]:
+    return str(value) if value else None
+
+
+def _content_hash(payload: Dict[str, Any]) -> str:
+    """Hash of what embedding + retrieval depend on (text, source, created_time); fetched_at is ignored."""
+    content = {"text": payload["text"], "source": payload["source"], "created_time": payload.get("created_time")}
+    # Chunk đầu của document dài: full_text đổi (thread thêm comment) thì phải ghi lại point
+    if "full_text" in payload:
+        content["full_text"] = payload["full_text"]
+    raw = json.dumps(content, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _doc_key(doc_id: str) -> int:
+    """64-bit key of a doc_id (8 bytes/doc for the set of documents seen in this run)."""
+    return int.from_bytes(hashlib.blake2b(doc_id.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+# ============================
+# Documents (1 payload / document)
+# ============================
+
+def post_document(post: Dict[str, Any]) -> Dict[str, Any]:
+    post_id = str(post.get("_id"))
+    message = (post.get("message") or "").strip()
+    return {
+        "doc_id": f"post::{post_id}",
+        "type": "post",
+        "text": message or "[NO_MESSAGE]",
+        "source": {
+            "post_id": post_id,
+            "permalink_url": post.get("permalink_url"),
+            "thread_id": post_id,
+        },
+        "created_time": _str_or_none(post.get("created_time")),
+        "fetched_at": _str_or_none(post.get("fetched_at")),
+    }
+
+
+def _comment_source(cmt: Dict[str, Any]) -> Dict[str, Any]:
+    post_id = cmt.get("post_id")
+    post_id_str = str(post_id) if post_id is not None else None
+    return {
+        "post_id": post_id_str,
+        "comment_id": str(cmt.get("_id")),
+        "permalink_url": cmt.get("permalink_url"),
+        "thread_id": post_id_str,
+    }
+
+
+def comment_document(cmt: Dict[str, Any]) -> Dict[str, Any]:
+    """Base comment document (giữ nguyên để build COMMENTS context)."""
+    raw_message = (cmt.get("message") or "").strip()
+    return {
+        "doc_id": f"comment::{cmt.get('_id')}",
+        "type": "comment",
+        "text": raw_message or "[NO_MESSAGE]",
+        "source": _comment_source(cmt),
+        "created_time": _str_or_none(cmt.get("created_time")),
+        "fetched_at": _str_or_none(cmt.get("fetched_at")),
+    }
+
+
+def comment_context_document(
+    cmt: Dict[str, Any], post_message: str
+) -> Optional[Dict[str, Any]]:
+    """Bài viết + Bình luận (chỉ với comment đủ dài và post có nội dung)."""
+    raw_message = (cmt.get("message") or "").strip()
+    if not (raw_message and len(raw_message) > 10 and post_message):
+        return None
+    return {
+        "doc_id": f"comment_context::{cmt.get('_id')}",
+        "type": "comment_context",
+        "text": f"Bài viết: {post_message}\nBình luận: {raw_message}",
+        "source": _comment_source(cmt),
+        "created_time": _str_or_none(cmt.get("created_time")),
+        "fetched_at": _str_or_none(cmt.get("fetched_at")),
+    }
+
+
+def thread_summary_document(
+    post: Dict[str, Any], comments: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """1 doc/thread: post + các ý chính từ comment (chỉ comment đủ dài)."""
+    post_id = str(post.get("_id"))
+    post_message = (post.get("message") or "").strip() or "[NO_MESSAGE]"
+    comment_texts = [
+        raw for raw in ((c.get("message") or "").strip() for c in comments)
+        if raw and len(raw) > 10
+    ]
+
+    lines = [f"Thread: {post_message}"]
+    if comment_texts:
+        lines.append("Các ý chính từ bình luận:")
+        for c in comment_texts:
+            lines.append(f"- {c}")
+    else:
+        lines.append("Các ý chính từ bình luận: (chưa có)")
+
+    return {
+        "doc_id": f"thread_summary::{post_id}",
+        "type": "thread_summary",
+        "text": "\n".join(lines),
+        "source": {
+            "post_id": post_id,
+            "permalink_url": post.get("permalink_url"),
+            "thread_id": post_id,
+        },
+        "created_time": _str_or_none(post.get("created_time")),
+        "fetched_at": _str_or_none(post.get("fetched_at")),
+    }
+
+
+def iter_threads(
+    posts: Iterable[Dict[str, Any]],
+    comments: Iterable[Dict[str, Any]],
+) -> Iterator[Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]]:
+    """
+    Merge-join posts sorted by ``_id`` with comments sorted by ``post_id``.
+
+    Yields (post, its comments) per post and (None, [comment]) for comments whose post
+    is missing, so only one thread is held in memory. Ids are the Graph API string ids
+    written by the crawlers (Mongo's binary string order == Python str order).
+    """
+    comments = iter(comments)
+    pending = next(comments, None)
+
+    def key(cmt: Dict[str, Any]) -> str:
+        return str(cmt["post_id"]) if cmt.get("post_id") is not None else ""
+
+    for post in posts:
+        post_id = str(post.get("_id"))
+        while pending is not None and key(pending) < post_id:
+            yield None, [pending]
+            pending = next(comments, None)
+        thread: List[Dict[str, Any]] = []
+        while pending is not None and key(pending) == post_id:
+            thread.append(pending)
+            pending = next(comments, None)
+        yield post, thread
+    while pending is not None:
+        yield None, [pending]
+        pending = next(comments, None)
+
+
+def iter_knowledge_documents(source_db: Any, chunker: Optional[Chunker] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Stream post, comment, comment_context and thread_summary payloads, thread by thread.
+
+    With a ``chunker``, long posts and thread summaries come out as their chunks.
+    """
+    def chunks(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return chunker.split_document(payload) if chunker is not None else [payload]
+
+    comments_col = source_db["comments"]
+    # Comment trong 1 thread theo thứ tự thời gian (+ _id): text thread_summary ổn định giữa các
+    # lần chạy, không bị coi là "đổi nội dung" chỉ vì Mongo trả về thứ tự khác
+    comment_order = [("post_id", ASCENDING), ("created_time", ASCENDING), ("_id", ASCENDING)]
+    try:
+        # Index đủ cả 3 key của sort: sort bên dưới là index scan, comment ra ngay từ thread đầu.
+        # Thiếu key nào thì Mongo phải sort chặn cả collection trước khi trả document đầu tiên
+        # (allow_disk_use chỉ để không lỗi khi không tạo được index)
+        comments_col.create_index(comment_order)
+    except Exception as e:
+        print(f"Warning: Could not create index on comments (post_id, created_time, _id): {e}")
+
+    posts = source_db["posts"].find({}, POST_FIELDS).sort("_id", ASCENDING)
+    comments = comments_col.find({}, COMMENT_FIELDS, allow_disk_use=True).sort(comment_order)
+    for post, thread in iter_threads(posts, comments):
+        post_message = (post.get("message") or "").strip() if post is not None else ""
+        if post is not None:
+            yield from chunks(post_document(post))
+        for cmt in thread:
+            yield comment_document(cmt)
+            context = comment_context_document(cmt, post_message)
+            if context is not None:
+                yield context
+        if post is not None:
+            yield from chunks(thread_summary_document(post, thread))
+
+
+# ============================
+# Embedding
+# ============================
+
+class Embedder:
+    """
+    BGE-M3 encoder shared by the pipeline passes; the model is loaded on first use.
+
+    With a cache, only texts missing from it are encoded (a rebuild of an unchanged
+    corpus never loads the model); identical texts within a batch are encoded once.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = ENCODE_BATCH_SIZE,
+        use_sparse: bool = False,
+        cache: Optional[EmbeddingCache] = None,
+        token_budget: int = ENCODE_TOKEN_BUDGET,
+        named_vectors: bool = True,
+    ) -> None:
+        self.batch_size = batch_size
+        self.use_sparse = use_sparse
+        self.cache = cache
+        self.token_budget = token_budget
+        # Layout của collection: named dense + sparse gốc của Qdrant,
+        # hoặc (collection cũ) một dense vector không tên + sparse trong payload
+        self.named_vectors = named_vectors
+        self.n_encoded = 0
+        self.n_cached = 0
+        self.n_tokens = 0
+        self.n_padded_tokens = 0
+        self.encode_seconds = 0.0
+        self._model: Optional[BGEM3FlagModel] = None
+
+    def payload_fields(self) -> List[str]:
+        """Payload fields ``is_current`` needs (legacy sparse dict only when sparse is on)."""
+        legacy_sparse = self.use_sparse and not self.named_vectors
+        return ["embedding_model", "has_sparse"] + (["sparse_embedding"] if legacy_sparse else [])
+
+    def is_current(self, payload: Dict[str, Any]) -> bool:
+        """True if a stored point already carries this embedder's vectors."""
+        if payload.get("embedding_model") != EMBEDDING_MODEL:
+            return False
+        if not self.use_sparse:
+            return True
+        # Sparse vector gốc không đọc được qua payload: point ghi kèm sparse có cờ "has_sparse"
+        return bool(payload.get("has_sparse")) or (not self.named_vectors and "sparse_embedding" in payload)
+
+    def _batches(self, lengths: List[int]) -> Iterator[List[int]]:
+        """Index batches: longest first, each within the token budget (padded) and batch_size."""
+        if self.token_budget <= 0:
+            yield from _batched(range(len(lengths)), self.batch_size)
+            return
+        batch: List[int] = []
+        for i in sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True):
+            # Sort giảm dần: text đầu batch là dài nhất -> padded = len(batch) x lengths[batch[0]]
+            if batch and (
+                len(batch) >= self.batch_size or (len(batch) + 1) * lengths[batch[0]] > self.token_budget
+            ):
+                yield batch
+                batch = []
+            batch.append(i)
+        if batch:
+            yield batch
+
+    def _encode(self, texts: List[str]) -> List[Entry]:
+        if self._model is None:
+            # Sync không có gì mới/đổi thì không tốn thời gian load model (~2GB)
+            self._model = BGEM3FlagModel(EMBEDDING_MODEL, use_fp16=True)
+        lengths = [
+            len(ids)
+            for ids in self._model.tokenizer(
+                texts, add_special_tokens=True, truncation=True, max_length=ENCODE_MAX_LENGTH
+            )["input_ids"]
+        ]
+
+        results: List[Optional[Entry]] = [None] * len(texts)
+        for batch in self._batches(lengths):
+            started = time.perf_counter()
+            outputs = self._model.encode(
+                [texts[i] for i in batch],
+                batch_size=len(batch),
+                max_length=ENCODE_MAX_LENGTH,
+                return_dense=True,
+                return_sparse=self.use_sparse,
+                return_colbert_vecs=False,
+            )
+            self.encode_seconds += time.perf_counter() - started
+            self.n_tokens += sum(lengths[i] for i in batch)
+            self.n_padded_tokens += len(batch) * max(lengths[i] for i in batch)
+
+            dense_vectors = outputs["dense_vecs"]
+            sparse_vectors = outputs.get("sparse_vecs", []) if self.use_sparse else []
+            # Trả kết quả về đúng vị trí gốc của text
+            for idx, i in enumerate(batch):
+                results[i] = (
+                    # Convert to float32 to reduce storage size
+                    np.asarray(dense_vectors[idx], dtype=np.float32),
+                    {int(k): float(v) for k, v in sparse_vectors[idx].items()} if sparse_vectors else None,
+                )
+        return results
+
+    def encode(self, texts: List[str]) -> List[Entry]:
+        """(dense, sparse or None) per text, from the cache when possible."""
+        texts = [normalize_text(t) for t in texts]
+        unique = list(dict.fromkeys(texts))
+        results: Dict[str, Entry] = {}
+        if self.cache is not None:
+            keys = {t: self.cache.key(t) for t in unique}
+            hits = self.cache.get_many(list(keys.values()), with_sparse=self.use_sparse)
+            results.update((t, hits[k]) for t, k in keys.items() if k in hits)
+        misses = [t for t in unique if t not in results]
+        if misses:
+            encoded = self._encode(misses)
+            results.update(zip(misses, encoded))
+            if self.cache is not None:
+                self.cache.put_many((keys[t], dense, sparse) for t, (dense, sparse) in zip(misses, encoded))
+        self.n_encoded += len(misses)
+        self.n_cached += len(unique) - len(misses)
+        return [results[t] for t in texts]
+
+    def points(self, ids: List[Any], payloads: List[Dict[str, Any]]) -> List[PointStruct]:
+        """Embed the payloads' texts and return ready-to-upsert points."""
+        entries = self.encode([str(p.get("text", "")) for p in payloads])
+        # Mốc cho RAGRetriever.refresh(): lấy lúc ghi (không phải lúc bắt đầu chạy),
+        # để retriever poll giữa chừng không bỏ sót các batch ghi sau
+        written_at = time.time()
+
+        points: List[PointStruct] = []
+        for point_id, payload, (dense, sparse) in zip(ids, payloads, entries):
+            vec32 = dense.tolist()
+            payload = dict(payload)
+            payload["embedding_model"] = EMBEDDING_MODEL
+            payload["embedding_dim"] = len(vec32)
+            payload["updated_at"] = written_at
+            sparse = sparse if self.use_sparse else None
+            if sparse is not None:
+                payload["has_sparse"] = True
+                if not self.named_vectors:
+                    payload["sparse_embedding"] = sparse
+            if self.named_vectors:
+                # Sparse nằm trong vector "sparse"; bản sao cũ trong payload (nếu có) bỏ đi
+                payload.pop("sparse_embedding", None)
+            points.append(PointStruct(id=point_id, vector=point_vector(self.named_vectors, vec32, sparse), payload=payload))
+        return points
+
+    def stats(self) -> str:
+        if not self.n_encoded:
+            return f"0 texts encoded, {self.n_cached} from cache"
+        return (
+            f"{self.n_encoded} texts encoded at {self.n_tokens / max(self.encode_seconds, 1e-9):.0f} tokens/s "
+            f"({self.n_tokens / max(self.n_padded_tokens, 1):.0%} of padded tokens are real), "
+            f"{self.n_cached} from cache"
+        )
+
+    def close(self) -> None:
+        if self.cache is not None:
+            self.cache.close()
+
+
+# ============================
+# Sync với Qdrant
+# ============================
+
+def _changed_documents(
+    qdrant_client, collection_name: str, batch: List[Dict[str, Any]], embedder: Embedder
+) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """(point ids, payloads) of the batch's documents that are new, changed, tombstoned or not embedded yet."""
+    ids = [doc_point_id(p["doc_id"]) for p in batch]
+    existing = {
+        str(p.id): p.payload or {}
+        for p in qdrant_client.retrieve(
+            collection_name=collection_name,
+            ids=ids,
+            with_payload=["content_hash", "deleted"] + embedder.payload_fields(),
+            with_vectors=False,
+        )
+    }
+    todo_ids: List[str] = []
+    todo: List[Dict[str, Any]] = []
+    for point_id, payload in zip(ids, batch):
+        payload["content_hash"] = _content_hash(payload)
+        old = existing.get(point_id)
+        if (
+            old is not None
+            and old.get("content_hash") == payload["content_hash"]
+            and not old.get("deleted")
+            # Point vector zero của pipeline 2 bước cũ: embed luôn ở lần chạy này
+            and embedder.is_current(old)
+        ):
+            continue
+        todo_ids.append(point_id)
+        todo.append(payload)
+    return todo_ids, todo
+
+
+def _sweep(qdrant_client, collection_name: str, seen: np.ndarray) -> Tuple[int, int]:
+    """
+    Stream the collection once: tombstone documents not seen in this run and delete
+    points of the old integer-id layout. Returns (tombstoned, legacy removed).
+    """
+    tombstones: List[Any] = []
+    legacy_ids: List[Any] = []
+    n_tombstoned = n_legacy = 0
+
+    def flush(force: bool = False) -> None:
+        nonlocal tombstones, legacy_ids, n_tombstoned, n_legacy
+        if tombstones and (force or len(tombstones) >= WRITE_BATCH_SIZE):
+            # Tombstone giữ nguyên point (retriever bỏ qua "deleted"); nguồn xuất hiện lại thì được upsert lại
+            qdrant_client.set_payload(
+                collection_name=collection_name,
+                payload={"deleted": True, "updated_at": time.time()},
+                points=tombstones,
+                wait=True,
+            )
+            n_tombstoned += len(tombstones)
+            tombstones = []
+        if legacy_ids and (force or len(legacy_ids) >= WRITE_BATCH_SIZE):
+            qdrant_client.delete(
+                collection_name=collection_name,
+                points_selector=PointIdsList(points=legacy_ids),
+                wait=True,
+            )
+            n_legacy += len(legacy_ids)
+            legacy_ids = []
+
+    offset = None
+    while True:
+        points, offset = qdrant_client.scroll(
+            collection_name=collection_name,
+            limit=1000,
+            with_payload=["doc_id", "deleted"],
+            with_vectors=False,
+            offset=offset,
+        )
+        for p in points:
+            payload = p.payload or {}
+            doc_id = payload.get("doc_id")
+            if not doc_id:
+                continue  # point version của collection
+            if str(p.id) != doc_point_id(doc_id):
+                # Point từ lần index cũ (id là bộ đếm int): bản id cố định đã được upsert ở trên
+                legacy_ids.append(p.id)
+                continue
+            if payload.get("deleted"):
+                continue
+            key = np.uint64(_doc_key(doc_id))
+            pos = np.searchsorted(seen, key)
+            if pos >= seen.shape[0] or seen[pos] != key:
+                tombstones.append(p.id)
+        flush()
+        if not points or offset is None:
+            break
+    flush(force=True)
+    return n_tombstoned, n_legacy
+
+
+# ============================
+# Entry points
+# ============================
+
+def ensure_collection(qdrant_client, collection_name: str) -> bool:
+    """
+    Create the collection and the payload indexes the retriever filters on (idempotent).
+
+    New collections get the named dense + sparse layout. Returns True if the collection
+    uses it, False for a legacy collection (sparse weights kept in the payload).
+    """
+    # Tạo Qdrant collection nếu chưa tồn tại (không xóa/tạo lại: search vẫn chạy trong lúc sync)
+    collections = qdrant_client.get_collections().collections
+    if not any(c.name == collection_name for c in collections):
+        create_named_collection(qdrant_client, collection_name, EMBEDDING_DIM)
+        print(f"Created Qdrant collection '{collection_name}'")
+        named = True
+    else:
+        named = uses_named_vectors(qdrant_client, collection_name)
+        if not named:
+            print(
+                f"Note: collection '{collection_name}' uses the legacy layout (sparse weights in the payload); "
+                "run scripts/migrate_named_vectors.py to move them to native sparse vectors."
+            )
+
+    # Payload index: retriever lọc "type" phía server và lấy post theo "doc_id"
+    # (Qdrant Cloud bắt buộc có index để filter)
+    # "updated_at" (float): RAGRetriever.refresh() chỉ scroll các point ghi sau lần sync trước
+    for field_name, schema in (
+        ("type", PayloadSchemaType.KEYWORD),
+        ("doc_id", PayloadSchemaType.KEYWORD),
+        ("updated_at", PayloadSchemaType.FLOAT),
+    ):
+        try:
+            qdrant_client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=schema,
+            )
+        except Exception as e:
+            print(f"Warning: Could not create payload index on '{field_name}': {e}")
+    return named
+
+
+def _zero_vector(named: bool) -> Any:
+    # Vector của point đánh dấu version (không phải tài liệu)
+    return point_vector(named, np.zeros(EMBEDDING_DIM, dtype=np.float32).tolist())
+
+
+def _print_stage_stats(stats: List[StageStats]) -> None:
+    for stage in stats:
+        print(f"  - {stage}")
+    print(f"  - bottleneck: {bottleneck(stats).name}")
+
+
+def open_embedding_cache() -> EmbeddingCache:
+    return EmbeddingCache(Path(PIPELINE_STATE_DIR) / EMBEDDING_CACHE_FILE, EMBEDDING_MODEL)
+
+
+def run_pipeline(
+    batch_size: int = ENCODE_BATCH_SIZE,
+    collection_name: Optional[str] = None,
+    use_sparse: bool = False,
+    use_cache: bool = True,
+    token_budget: int = ENCODE_TOKEN_BUDGET,
+    chunk_tokens: int = CHUNK_MAX_TOKENS,
+    chunk_overlap: int = CHUNK_OVERLAP_TOKENS,
+) -> int:
+    """
+    Sync the knowledge base from MongoDB into Qdrant, embeddings included.
+
+    Streams posts and comments from the source DB configured in .env
+    (MONGO_DB_SOURCE). Per batch of WRITE_BATCH_SIZE documents, only new/changed
+    documents (or ones still without a BGE-M3 vector) are embedded and upserted in a
+    single call; documents whose source disappeared are tombstoned (payload ``deleted``).
+    Reading, encoding and uploading overlap (stages.run_stages). Posts and thread
+    summaries longer than ``chunk_tokens`` are stored as overlapping chunks of that many
+    tokens (``chunk_tokens=0``: never chunked). Returns the number of points written.
+    """
+    if collection_name is None:
+        collection_name = QDRANT_COLLECTION_NAME
+
+    mongo_client = get_mongo_client()
+    qdrant_client = get_qdrant_client()
+    source_db = mongo_client[MONGO_DB_SOURCE]
+    named = ensure_collection(qdrant_client, collection_name)
+    chunker = Chunker(EMBEDDING_MODEL, chunk_tokens, chunk_overlap) if chunk_tokens > 0 else None
+
+    # Cache SQLite (PIPELINE_STATE_DIR): text đã embed ở lần chạy trước không encode lại
+    cache = open_embedding_cache() if use_cache else None
+    embedder = Embedder(
+        batch_size=batch_size, use_sparse=use_sparse, cache=cache, token_budget=token_budget, named_vectors=named
+    )
+    try:
+        seen = array("Q")
+        n_docs = 0
+        n_written = 0
+
+        def read() -> Iterator[Tuple[int, List[str], List[Dict[str, Any]]]]:
+            # Stage đọc: stream Mongo + so content_hash với Qdrant, chạy song song với encode
+            for batch in _batched(iter_knowledge_documents(source_db, chunker), WRITE_BATCH_SIZE):
+                seen.extend(_doc_key(p["doc_id"]) for p in batch)
+                todo_ids, todo = _changed_documents(qdrant_client, collection_name, batch, embedder)
+                yield len(batch), todo_ids, todo
+
+        def on_uploaded(item: Tuple[int, List[str], List[Dict[str, Any]]], points: List[PointStruct]) -> None:
+            nonlocal n_docs, n_written
+            n_docs += item[0]
+            n_written += len(points)
+            print(f"Processed {n_docs} documents ({n_written} embedded + written)")
+
+        stats = run_stages(
+            read(),
+            encode=lambda item: embedder.points(item[1], item[2]) if item[1] else [],
+            upload=lambda points: qdrant_client.upsert(collection_name=collection_name, points=points, wait=True),
+            on_uploaded=on_uploaded,
+            read_size=lambda item: item[0],
+            queue_size=STAGE_QUEUE_SIZE,
+            upload_workers=UPLOAD_WORKERS,
+        )
+        _print_stage_stats(stats)
+
+        if n_docs == 0:
+            # Không tombstone cả collection chỉ vì Mongo rỗng (thường là cấu hình sai DB)
+            print("No posts/comments found in MongoDB.")
+            return 0
+
+        seen_sorted = np.sort(np.frombuffer(seen, dtype=np.uint64))
+        n_tombstoned, n_legacy = _sweep(qdrant_client, collection_name, seen_sorted)
+        print(
+            f"Synced {n_docs} documents into Qdrant collection '{collection_name}': "
+            f"{n_written} embedded + written, {n_docs - n_written} unchanged, {n_tombstoned} tombstoned, "
+            f"{n_legacy} legacy points removed ({embedder.stats()})."
+        )
+        if chunker is not None and chunker.n_chunked:
+            print(f"  - {chunker.n_chunked} long posts / thread summaries split into chunks of {chunk_tokens} tokens")
+        if not (n_written or n_tombstoned or n_legacy):
+            return 0
+
+        # Đổi version để các retriever biết snapshot mmap trên đĩa đã cũ
+        # (vector zero chỉ dùng cho point đánh dấu version, không phải tài liệu)
+        bump_collection_version(qdrant_client, collection_name, _zero_vector(named))
+        return n_written + n_tombstoned
+    finally:
+        embedder.close()
+
+
+def _checkpoint_path(collection_name: str, shard: int = 0, n_shards: int = 1) -> Path:
+    name = "embed_checkpoint.json" if n_shards == 1 else f"embed_checkpoint.{shard}of{n_shards}.json"
+    return Path(PIPELINE_STATE_DIR) / collection_name / name
+
+
+def _load_checkpoint(path: Path, use_sparse: bool) -> Optional[Dict[str, Any]]:
+    """Checkpoint of an interrupted embed_pending run with the same model/sparse setting, or None."""
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if data.get("embedding_model") != EMBEDDING_MODEL or data.get("use_sparse") != use_sparse:
+        return None
+    return data
+
+
+def _save_checkpoint(path: Path, data: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Ghi file tạm rồi rename: crash giữa chừng không để lại checkpoint hỏng
+    tmp = path.with_name(f".{path.name}.tmp-{os.getpid()}")
+    tmp.write_text(json.dumps(data), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _embed_range(
+    qdrant_client,
+    collection_name: str,
+    embedder: Embedder,
+    path: Path,
+    resume: bool = True,
+    start: Optional[str] = None,
+    stop: Optional[int] = None,
+    report: Optional[Callable[[int, int], None]] = None,
+) -> Tuple[int, int, List[StageStats]]:
+    """
+    Embed the pending points with ids from ``start`` up to ``stop`` (shards.id_key),
+    the whole collection by default, checkpointing to ``path`` after each page.
+    Returns (points scanned, points embedded, stage stats).
+    """
+    checkpoint = _load_checkpoint(path, embedder.use_sparse) if resume else None
+    offset = checkpoint["offset"] if checkpoint else start
+    scanned = checkpoint["scanned"] if checkpoint else 0
+    updated = checkpoint["updated"] if checkpoint else 0
+    if checkpoint:
+        print(f"Resuming from checkpoint {path.name}: {scanned} points scanned, {updated} embedded")
+
+    def read() -> Iterator[Tuple[int, List[Any], Any]]:
+        page_offset = offset
+        while True:
+            # Vector cũ không cần (chỉ ghi đè); payload cần vì upsert thay cả payload
+            points, next_offset = qdrant_client.scroll(
+                collection_name=collection_name,
+                limit=SCROLL_PAGE_SIZE,
+                offset=page_offset,
+                with_payload=True,
+                with_vectors=False,
+            )
+            if stop is not None and points and id_key(points[-1].id) >= stop:
+                # Trang chạm sang shard sau: chỉ lấy phần thuộc shard này rồi dừng
+                points = [p for p in points if id_key(p.id) < stop]
+                next_offset = None
+            # Bỏ qua point đánh dấu version của collection (không phải tài liệu)
+            docs = [p for p in points if (p.payload or {}).get("type") != COLLECTION_META_TYPE]
+            # Tombstone và point đã có embedding của model hiện tại thì không embed lại
+            todo = [
+                p for p in docs
+                if not (p.payload or {}).get("deleted") and not embedder.is_current(p.payload or {})
+            ]
+            yield len(docs), todo, next_offset
+            if not points or next_offset is None:
+                return
+            page_offset = next_offset
+
+    def on_uploaded(item: Tuple[int, List[Any], Any], points: List[PointStruct]) -> None:
+        nonlocal scanned, updated
+        n_docs, _, next_offset = item
+        scanned += n_docs
+        updated += len(points)
+        if report is not None:
+            report(scanned, updated)
+        else:
+            print(f"Processed {scanned} points ({updated} embedded)")
+        if next_offset is not None:
+            # Offset (point id đầu trang sau) chỉ lưu khi trang này và các trang trước đã upsert xong
+            _save_checkpoint(path, {
+                "embedding_model": EMBEDDING_MODEL,
+                "use_sparse": embedder.use_sparse,
+                "offset": next_offset,
+                "scanned": scanned,
+                "updated": updated,
+            })
+
+    def encode(item: Tuple[int, List[Any], Any]) -> List[PointStruct]:
+        todo = item[1]
+        return embedder.points([p.id for p in todo], [p.payload for p in todo]) if todo else []
+
+    stats = run_stages(
+        read(),
+        encode=encode,
+        upload=lambda points: qdrant_client.upsert(collection_name=collection_name, points=points, wait=True),
+        on_uploaded=on_uploaded,
+        read_size=lambda item: item[0],
+        queue_size=STAGE_QUEUE_SIZE,
+        upload_workers=UPLOAD_WORKERS,
+    )
+    path.unlink(missing_ok=True)
+    return scanned, updated, stats
+
+
+def _embed_shard(
+    shard: int,
+    n_shards: int,
+    collection_name: str,
+    named: bool,
+    batch_size: int,
+    use_sparse: bool,
+    use_cache: bool,
+    token_budget: int,
+    resume: bool,
+) -> Tuple[int, int, str]:
+    """Worker process of the sharded embed_pending: own Qdrant client, model and checkpoint."""
+    qdrant_client = get_qdrant_client()
+    cache = open_embedding_cache() if use_cache else None
+    embedder = Embedder(
+        batch_size=batch_size, use_sparse=use_sparse, cache=cache, token_budget=token_budget, named_vectors=named
+    )
+    try:
+        start, stop = shard_bounds(shard, n_shards)
+        scanned, updated, stats = _embed_range(
+            qdrant_client,
+            collection_name,
+            embedder,
+            _checkpoint_path(collection_name, shard, n_shards),
+            resume=resume,
+            start=start,
+            stop=stop,
+            report=lambda s, u: report_progress(shard, s, u),
+        )
+        return scanned, updated, f"{embedder.stats()}, bottleneck: {bottleneck(stats).name}"
+    finally:
+        embedder.close()
+
+
+def embed_pending(
+    batch_size: int = ENCODE_BATCH_SIZE,
+    collection_name: Optional[str] = None,
+    use_sparse: bool = False,
+    use_cache: bool = True,
+    token_budget: int = ENCODE_TOKEN_BUDGET,
+    resume: bool = True,
+    workers: int = 1,
+    threads_per_worker: Optional[int] = None,
+) -> int:
+    """
+    (Re-)embed points already in Qdrant that lack current BGE-M3 vectors.
+
+    run_pipeline() embeds everything it writes; this pass is for collections indexed by
+    the old two-step pipeline (zero-vector placeholders) or when sparse is turned on later.
+    Pages through the whole collection (SCROLL_PAGE_SIZE points per page) and saves the
+    next scroll offset under PIPELINE_STATE_DIR after each page, so an interrupted run
+    resumes where it stopped (``resume=False`` starts over). Scrolling, encoding and
+    uploading overlap (stages.run_stages).
+
+    ``workers > 1`` splits the point-id space into that many shards, each embedded by its
+    own process (own model, ``threads_per_worker`` torch threads, default cores / workers)
+    that writes to Qdrant and checkpoints on its own; resuming needs the same ``workers``.
+    """
+    if collection_name is None:
+        collection_name = QDRANT_COLLECTION_NAME
+
+    qdrant_client = get_qdrant_client()
+    named = uses_named_vectors(qdrant_client, collection_name)
+
+    print(f"Starting embedding generation for '{collection_name}' using BGE-M3...")
+    print("  - Dense embeddings: ON")
+    if use_sparse:
+        print("  - Sparse embeddings: ON (hybrid search)")
+
+    if workers > 1:
+        threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        print(f"  - Sharded: {workers} worker processes x {threads} torch threads")
+        results = run_shards(
+            _embed_shard, workers, threads,
+            collection_name, named, batch_size, use_sparse, use_cache, token_budget, resume,
+        )
+        for shard, (n_scanned, n_updated, summary) in enumerate(results):
+            print(f"  - shard {shard}: {n_scanned} points, {n_updated} embedded ({summary})")
+        scanned = sum(r[0] for r in results)
+        updated = sum(r[1] for r in results)
+        summary = f"{workers} workers"
+    else:
+        # Cache SQLite (PIPELINE_STATE_DIR): text đã embed ở lần chạy trước không encode lại
+        cache = open_embedding_cache() if use_cache else None
+        embedder = Embedder(
+            batch_size=batch_size, use_sparse=use_sparse, cache=cache, token_budget=token_budget, named_vectors=named
+        )
+        try:
+            scanned, updated, stats = _embed_range(
+                qdrant_client, collection_name, embedder, _checkpoint_path(collection_name), resume=resume
+            )
+            _print_stage_stats(stats)
+            summary = embedder.stats()
+        finally:
+            embedder.close()
+
+    if scanned == 0:
+        print(f"No documents found in Qdrant collection '{collection_name}'. Please run index_mongo.py first.")
+        return 0
+    if updated == 0:
+        print("All documents already have embeddings. Nothing to do.")
+        return 0
+
+    bump_collection_version(qdrant_client, collection_name, _zero_vector(named))
+
+    print(f"Hoan thanh. Da cap nhat embedding cho {updated} documents trong Qdrant ({summary}).")
+    return updated
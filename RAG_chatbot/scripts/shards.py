@@ -0,0 +1,88 @@
+"""Split the point-id space into shards, one worker process per shard, used by pipeline.py."""
+
+import multiprocessing
+import os
+import queue
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_UUID_SPACE = 1 << 128
+
+# Queue tiến độ của process cha, gán trong mỗi worker (_init_worker)
+_progress: Optional[Any] = None
+
+
+def shard_bounds(shard: int, n_shards: int) -> Tuple[Optional[str], Optional[int]]:
+    """
+    Scroll start (a UUID, None for the first shard) and exclusive upper bound (UUID as
+    int, None for the last shard) of one of ``n_shards`` equal slices of the UUID space.
+
+    Qdrant scrolls ids in order with integer ids before UUIDs, so leftover integer ids
+    fall in the first shard.
+    """
+    lower = shard * _UUID_SPACE // n_shards
+    upper = (shard + 1) * _UUID_SPACE // n_shards
+    start = str(uuid.UUID(int=lower)) if shard else None
+    stop = upper if shard < n_shards - 1 else None
+    return start, stop
+
+
+def id_key(point_id: Any) -> int:
+    """Sort key of a point id in Qdrant's scroll order (integer ids first)."""
+    if isinstance(point_id, int):
+        return -1
+    return uuid.UUID(str(point_id)).int
+
+
+def _init_worker(threads: int, progress: Any) -> None:
+    global _progress
+    _progress = progress
+    # Mỗi process một model: giới hạn thread để N process không tranh nhau cùng các core
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    import torch
+
+    torch.set_num_threads(threads)
+
+
+def report_progress(shard: int, scanned: int, updated: int) -> None:
+    """Send a worker's running totals to the parent (no-op outside run_shards)."""
+    if _progress is not None:
+        _progress.put((shard, scanned, updated))
+
+
+def run_shards(worker: Callable[..., Any], n_shards: int, threads: int, *args: Any) -> List[Any]:
+    """
+    Run ``worker(shard, n_shards, *args)`` for every shard in its own process.
+
+    Each process gets ``threads`` torch threads. Progress sent with report_progress()
+    is merged and printed as it arrives. Returns the workers' results in shard order;
+    a worker error is raised once every worker has finished (the other shards' work
+    and checkpoints are kept).
+    """
+    # spawn: fork sau khi torch/Qdrant client đã khởi tạo thread không an toàn
+    ctx = multiprocessing.get_context("spawn")
+    progress = ctx.Queue()
+    totals: Dict[int, Tuple[int, int]] = {}
+
+    def merge(item: Tuple[int, int, int], n_done: int) -> None:
+        shard, scanned, updated = item
+        totals[shard] = (scanned, updated)
+        print(
+            f"Processed {sum(s for s, _ in totals.values())} points "
+            f"({sum(u for _, u in totals.values())} embedded, {n_done}/{n_shards} shards done)"
+        )
+
+    with ProcessPoolExecutor(
+        max_workers=n_shards, mp_context=ctx, initializer=_init_worker, initargs=(threads, progress)
+    ) as pool:
+        futures = [pool.submit(worker, shard, n_shards, *args) for shard in range(n_shards)]
+        while True:
+            n_done = sum(f.done() for f in futures)
+            try:
+                merge(progress.get(timeout=0.5), n_done)
+            except queue.Empty:
+                if n_done == n_shards:
+                    break
+        return [f.result() for f in futures]
@@ -0,0 +1,147 @@
+"""Read -> encode -> upload pipeline with bounded queues, used by pipeline.py."""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Iterable, List, Optional, Tuple
+
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+class StageStats:
+    """
+    Throughput counters of one stage.
+
+    ``busy``: seconds spent doing the stage's work (summed over workers),
+    ``starved``: seconds waiting for input, ``blocked``: seconds waiting for room downstream.
+    The stage with the most busy time per worker is the bottleneck.
+    """
+
+    def __init__(self, name: str, workers: int = 1) -> None:
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items: int, busy: float) -> None:
+        with self._lock:
+            self.items += items
+            self.busy += busy
+
+    def __str__(self) -> str:
+        rate = self.items / self.busy if self.busy else 0.0
+        per_worker = f" per worker, {self.workers} workers" if self.workers > 1 else ""
+        line = f"{self.name}: {self.items} points, {self.busy:.1f}s busy ({rate:.0f} points/s{per_worker})"
+        if self.starved or self.blocked:
+            line += f", {self.starved:.1f}s starved, {self.blocked:.1f}s blocked"
+        return line
+
+
+def bottleneck(stats: List[StageStats]) -> StageStats:
+    return max(stats, key=lambda s: s.busy / s.workers)
+
+
+def run_stages(
+    read: Iterable[Any],
+    encode: Callable[[Any], List[Any]],
+    upload: Callable[[List[Any]], None],
+    on_uploaded: Optional[Callable[[Any, List[Any]], None]] = None,
+    read_size: Callable[[Any], int] = len,
+    queue_size: int = 2,
+    upload_workers: int = 2,
+) -> List[StageStats]:
+    """
+    Run ``read`` in a thread, ``encode`` in the calling thread and ``upload`` on a pool.
+
+    ``read`` yields items (at most ``queue_size`` buffered); ``encode(item)`` returns the
+    points to write (possibly empty); uploads run concurrently, at most
+    ``queue_size + upload_workers`` in flight. ``on_uploaded(item, points)`` is called in
+    read order once the item and every earlier one are written, so it can checkpoint.
+    The first error of any stage is raised after in-flight uploads finish.
+    """
+    read_stats = StageStats("read")
+    encode_stats = StageStats("encode")
+    upload_stats = StageStats("upload", workers=upload_workers)
+    items: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def reader() -> None:
+        try:
+            it = iter(read)
+            while True:
+                started = time.perf_counter()
+                item = next(it, _DONE)
+                if item is _DONE:
+                    break
+                read_stats.add(read_size(item), time.perf_counter() - started)
+                started = time.perf_counter()
+                if not put(item):
+                    return
+                read_stats.blocked += time.perf_counter() - started
+        except BaseException as e:
+            put(_Failed(e))
+            return
+        put(_DONE)
+
+    def timed_upload(points: List[Any]) -> None:
+        started = time.perf_counter()
+        upload(points)
+        upload_stats.add(len(points), time.perf_counter() - started)
+
+    pending: Deque[Tuple[Any, List[Any], Optional[Future]]] = deque()
+
+    def drain(limit: int) -> None:
+        # Hoàn tất theo đúng thứ tự đọc: checkpoint không vượt qua batch chưa ghi xong
+        while pending and (len(pending) > limit or pending[0][2] is None or pending[0][2].done()):
+            item, points, future = pending.popleft()
+            if future is not None:
+                started = time.perf_counter()
+                future.result()
+                encode_stats.blocked += time.perf_counter() - started
+            if on_uploaded is not None:
+                on_uploaded(item, points)
+
+    thread = threading.Thread(target=reader, name="pipeline-read", daemon=True)
+    thread.start()
+    try:
+        with ThreadPoolExecutor(max_workers=upload_workers, thread_name_prefix="pipeline-upload") as pool:
+            while True:
+                started = time.perf_counter()
+                item = items.get()
+                encode_stats.starved += time.perf_counter() - started
+                if item is _DONE:
+                    break
+                if isinstance(item, _Failed):
+                    raise item.error
+
+                started = time.perf_counter()
+                points = encode(item)
+                encode_stats.add(len(points), time.perf_counter() - started)
+                future = pool.submit(timed_upload, points) if points else None
+                pending.append((item, points, future))
+                drain(queue_size + upload_workers)
+            drain(0)
+    finally:
+        stop.set()
+        thread.join()
+
+    return [read_stats, encode_stats, upload_stats]
@@ -0,0 +1,191 @@
+"""
+IVF (inverted file) approximate nearest-neighbour index over normalized dense vectors.
+
+Spherical k-means splits the rows into ``n_lists`` cells; a query only scans the rows of
+its ``nprobe`` closest cells. Pure numpy (no faiss/hnswlib dependency), persisted as
+``.npy`` files so it can live next to the retriever snapshot and be mmap-loaded.
+"""
+
+import json
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+ANN_FORMAT = 1
+# Số row mỗi lần gán cell (giới hạn RAM tạm khi build trên ma trận lớn)
+_ASSIGN_CHUNK_ROWS = 16384
+
+
+def _as_f32(mat: np.ndarray) -> np.ndarray:
+    return mat if mat.dtype == np.float32 else mat.astype(np.float32)
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    return mat / (np.linalg.norm(mat, axis=1, keepdims=True) + 1e-8)
+
+
+def _exact_scores(normed: np.ndarray, q: np.ndarray) -> np.ndarray:
+    """Brute-force cosine of q against every row, chunked so float16/mmap rows upcast in pieces."""
+    return np.concatenate([
+        _as_f32(np.asarray(normed[s : s + _ASSIGN_CHUNK_ROWS])) @ q
+        for s in range(0, normed.shape[0], _ASSIGN_CHUNK_ROWS)
+    ])
+
+
+def _assign_rows(normed: np.ndarray, centroids: np.ndarray, rows: np.ndarray, out: np.ndarray) -> None:
+    """out[rows] = nearest centroid of each row, computed in chunks."""
+    for start in range(0, rows.shape[0], _ASSIGN_CHUNK_ROWS):
+        idx = rows[start : start + _ASSIGN_CHUNK_ROWS]
+        out[idx] = np.argmax(_as_f32(np.asarray(normed[idx])) @ centroids.T, axis=1)
+
+
+class IVFIndex:
+    """Cells of row ids (``order[offsets[c]:offsets[c + 1]]``) around unit-norm ``centroids``."""
+
+    def __init__(self, centroids: np.ndarray, order: np.ndarray, offsets: np.ndarray, n_docs: int) -> None:
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.n_docs = int(n_docs)
+
+    @property
+    def n_lists(self) -> int:
+        return int(self.centroids.shape[0])
+
+    @classmethod
+    def build(
+        cls,
+        normed: np.ndarray,
+        n_lists: Optional[int] = None,
+        iters: int = 10,
+        train_size: Optional[int] = None,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """Train centroids with spherical k-means on a sample, then assign every row."""
+        n = int(normed.shape[0])
+        if n_lists is None:
+            n_lists = int(np.sqrt(n))
+        n_lists = max(1, min(int(n_lists), n))
+        rng = np.random.default_rng(seed)
+
+        train_size = min(n, train_size or max(n_lists * 64, 10_000))
+        sample_idx = np.sort(rng.choice(n, size=train_size, replace=False))
+        sample = _as_f32(np.asarray(normed[sample_idx]))
+        centroids = sample[rng.choice(train_size, size=n_lists, replace=False)].copy()
+        for _ in range(iters):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=n_lists)
+            empty = counts == 0
+            if empty.any():
+                # Cell rỗng -> gieo lại bằng row ngẫu nhiên
+                sums[empty] = sample[rng.choice(train_size, size=int(empty.sum()), replace=False)]
+            centroids = _normalize(sums).astype(np.float32)
+
+        assign = np.empty(n, dtype=np.int32)
+        _assign_rows(normed, centroids, np.arange(n), assign)
+        return cls._from_assignment(centroids, assign)
+
+    @classmethod
+    def _from_assignment(cls, centroids: np.ndarray, assign: np.ndarray) -> "IVFIndex":
+        n_lists = int(centroids.shape[0])
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=n_lists), out=offsets[1:])
+        return cls(centroids, order, offsets, assign.shape[0])
+
+    def updated(self, normed: np.ndarray, rows: np.ndarray) -> "IVFIndex":
+        """
+        Copy with ``rows`` (changed or appended; every row >= n_docs must be listed) reassigned
+        to their nearest centroid. Centroids are kept, so a full rebuild is still worthwhile
+        once the corpus has drifted a lot.
+        """
+        assign = np.empty(int(normed.shape[0]), dtype=np.int32)
+        assign[np.asarray(self.order)] = np.repeat(
+            np.arange(self.n_lists, dtype=np.int32), np.diff(self.offsets)
+        )
+        _assign_rows(normed, self.centroids, np.sort(np.asarray(rows, dtype=np.int64)), assign)
+        return self._from_assignment(self.centroids, assign)
+
+    def probe(self, q: np.ndarray, nprobe: int) -> np.ndarray:
+        """Row ids of the nprobe cells closest to unit-norm query q."""
+        nprobe = max(1, min(int(nprobe), self.n_lists))
+        cell_scores = self.centroids @ q
+        if nprobe < self.n_lists:
+            cells = np.argpartition(-cell_scores, nprobe - 1)[:nprobe]
+        else:
+            cells = np.arange(self.n_lists)
+        parts = [self.order[self.offsets[c] : self.offsets[c + 1]] for c in cells]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def search(
+        self,
+        normed: np.ndarray,
+        q: np.ndarray,
+        n_candidates: int,
+        nprobe: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact cosine of the probed rows -> (top n_candidates row ids, their scores), unsorted."""
+        rows = np.sort(self.probe(q, nprobe))
+        if rows.size == 0:
+            return rows, np.empty(0, dtype=np.float32)
+        scores = _as_f32(np.asarray(normed[rows])) @ q
+        if rows.size > n_candidates:
+            keep = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+            rows, scores = rows[keep], scores[keep]
+        return rows, scores
+
+    def recall_at_k(
+        self,
+        normed: np.ndarray,
+        queries: np.ndarray,
+        k: int,
+        nprobe: int,
+        n_candidates: Optional[int] = None,
+    ) -> float:
+        """Mean recall@k of search() against brute-force cosine for unit-norm queries."""
+        n_candidates = n_candidates or k
+        hits = 0
+        total = 0
+        for q in queries:
+            exact = _exact_scores(normed, q)
+            kk = min(k, exact.shape[0])
+            truth = set(np.argpartition(-exact, kk - 1)[:kk].tolist())
+            found, _ = self.search(normed, q, n_candidates, nprobe)
+            hits += len(truth & set(found.tolist()))
+            total += kk
+        return hits / total if total else 1.0
+
+    def save(self, path: Path, extra_meta: Optional[Dict[str, Any]] = None) -> None:
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "centroids.npy", self.centroids)
+        np.save(path / "order.npy", self.order)
+        np.save(path / "offsets.npy", self.offsets)
+        meta = {"format": ANN_FORMAT, "type": "ivf", "n_docs": self.n_docs, "n_lists": self.n_lists}
+        meta.update(extra_meta or {})
+        with open(path / "meta.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def load(cls, path: Path, expected_meta: Optional[Dict[str, Any]] = None) -> Optional["IVFIndex"]:
+        """Load a persisted index, or None if missing or built for different data."""
+        path = Path(path)
+        try:
+            with open(path / "meta.json", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("format") != ANN_FORMAT:
+                return None
+            for key, value in (expected_meta or {}).items():
+                if meta.get(key) != value:
+                    return None
+            return cls(
+                np.load(path / "centroids.npy"),
+                np.load(path / "order.npy", mmap_mode="r"),
+                np.load(path / "offsets.npy"),
+                meta["n_docs"],
+            )
+        except (OSError, ValueError, KeyError):
+            return None
@@ -0,0 +1,45 @@
+"""Copy-on-write list view used when a delta is applied on top of (mmap) snapshot caches."""
+
+from collections.abc import Sequence
+from typing import Any, Dict, List
+
+
+class PatchedList(Sequence):
+    """
+    Read-only view: ``base`` with some rows replaced and new rows appended.
+
+    The base (often a BlobList over the mmap snapshot) is never copied. Patching a
+    PatchedList flattens into one level so repeated deltas do not stack views.
+    """
+
+    def __init__(self, base: Sequence, replaced: Dict[int, Any], appended: List[Any]) -> None:
+        if isinstance(base, PatchedList):
+            n_base = len(base.base)
+            merged = dict(base.replaced)
+            tail = list(base.appended)
+            for idx, value in replaced.items():
+                if idx < n_base:
+                    merged[idx] = value
+                else:
+                    tail[idx - n_base] = value
+            base, replaced, appended = base.base, merged, tail + list(appended)
+        self.base = base
+        self.replaced = replaced
+        self.appended = list(appended)
+
+    def __len__(self) -> int:
+        return len(self.base) + len(self.appended)
+
+    def __getitem__(self, idx):  # type: ignore[override]
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        n_base = len(self.base)
+        if idx >= n_base:
+            return self.appended[idx - n_base]
+        if idx in self.replaced:
+            return self.replaced[idx]
+        return self.base[idx]
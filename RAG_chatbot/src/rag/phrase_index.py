@@ -0,0 +1,134 @@
+"""Character-trigram inverted index for exact (quoted) phrase lookup."""
+
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+
+from .patched import PatchedList
+
+# Mỗi ký tự unicode <= 21 bit -> 1 trigram = 1 int64 (không collision)
+_CHAR_BITS = 21
+# Đủ ít ứng viên thì dừng giao posting list, verify substring trực tiếp rẻ hơn
+_VERIFY_THRESHOLD = 32
+
+
+def _trigrams(text_lower: str) -> np.ndarray:
+    """Sorted unique trigram keys of an already-lowercased string."""
+    if len(text_lower) < 3:
+        return np.empty(0, dtype=np.int64)
+    cps = np.frombuffer(text_lower.encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    keys = (cps[:-2] << (2 * _CHAR_BITS)) | (cps[1:-1] << _CHAR_BITS) | cps[2:]
+    return np.unique(keys)
+
+
+class PhraseIndex:
+    """
+    Posting lists ``docs[indptr[r]:indptr[r + 1]]`` for trigram ``keys[r]``, plus the
+    lowercased doc texts (computed once) used to verify candidates.
+
+    A phrase's candidates are the intersection of its trigrams' posting lists, so
+    lookup cost follows the rarest trigram instead of the corpus size.
+    """
+
+    def __init__(
+        self,
+        texts_lower: Sequence[str],
+        keys: np.ndarray,
+        indptr: np.ndarray,
+        docs: np.ndarray,
+    ) -> None:
+        self.texts_lower = texts_lower
+        self.keys = keys
+        self.indptr = indptr
+        self.docs = docs
+
+    @classmethod
+    def build(cls, texts: Iterable[str]) -> "PhraseIndex":
+        texts_lower: List[str] = []
+        key_parts: List[np.ndarray] = []
+        doc_parts: List[np.ndarray] = []
+        for i, text in enumerate(texts):
+            lower = (text or "").lower()
+            texts_lower.append(lower)
+            grams = _trigrams(lower)
+            if grams.size:
+                key_parts.append(grams)
+                doc_parts.append(np.full(grams.size, i, dtype=np.int32))
+
+        return cls._from_postings(texts_lower, key_parts, doc_parts)
+
+    @classmethod
+    def _from_postings(
+        cls,
+        texts_lower: Sequence[str],
+        key_parts: List[np.ndarray],
+        doc_parts: List[np.ndarray],
+    ) -> "PhraseIndex":
+        if key_parts:
+            all_keys = np.concatenate(key_parts)
+            all_docs = np.concatenate(doc_parts)
+            order = np.lexsort((all_docs, all_keys))
+            all_keys, all_docs = all_keys[order], all_docs[order]
+            keys, counts = np.unique(all_keys, return_counts=True)
+        else:
+            all_docs = np.empty(0, dtype=np.int32)
+            keys = np.empty(0, dtype=np.int64)
+            counts = np.empty(0, dtype=np.int64)
+        indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(texts_lower, keys, indptr, all_docs)
+
+    def updated(self, texts: Dict[int, str]) -> "PhraseIndex":
+        """Copy with the texts of ``texts`` rows replaced; rows past the end are appended in order."""
+        n_docs = len(self.texts_lower)
+        keys = np.repeat(np.asarray(self.keys), np.diff(self.indptr))
+        docs = np.asarray(self.docs, dtype=np.int32)
+        if texts:
+            keep = ~np.isin(docs, np.fromiter(texts.keys(), dtype=np.int32, count=len(texts)))
+            keys, docs = keys[keep], docs[keep]
+
+        key_parts: List[np.ndarray] = [keys]
+        doc_parts: List[np.ndarray] = [docs]
+        replaced: Dict[int, str] = {}
+        appended: List[str] = []
+        for i in sorted(texts):
+            lower = (texts[i] or "").lower()
+            if i < n_docs:
+                replaced[i] = lower
+            else:
+                appended.append(lower)
+            grams = _trigrams(lower)
+            if grams.size:
+                key_parts.append(grams)
+                doc_parts.append(np.full(grams.size, i, dtype=np.int32))
+        return self._from_postings(PatchedList(self.texts_lower, replaced, appended), key_parts, doc_parts)
+
+    def matches(self, phrases: List[str]) -> np.ndarray:
+        """Sorted indices of docs whose lowercased text contains every (lowercased) phrase."""
+        candidates = None
+        for phrase in phrases:
+            grams = _trigrams(phrase)
+            if grams.size == 0:
+                continue  # cụm < 3 ký tự: không lọc được bằng trigram, chỉ verify
+            rows = np.searchsorted(self.keys, grams)
+            rows = np.minimum(rows, max(len(self.keys) - 1, 0))
+            if len(self.keys) == 0 or np.any(self.keys[rows] != grams):
+                return np.empty(0, dtype=np.int64)
+            # Giao từ posting list ngắn nhất
+            for row in rows[np.argsort(self.indptr[rows + 1] - self.indptr[rows])]:
+                if candidates is not None and candidates.size <= _VERIFY_THRESHOLD:
+                    break
+                postings = self.docs[self.indptr[row] : self.indptr[row + 1]]
+                candidates = postings if candidates is None else np.intersect1d(
+                    candidates, postings, assume_unique=True
+                )
+                if candidates.size == 0:
+                    return np.empty(0, dtype=np.int64)
+
+        if candidates is None:
+            candidates = np.arange(len(self.texts_lower))
+        hits = [
+            int(i) for i in candidates
+            if all(phrase in self.texts_lower[int(i)] for phrase in phrases)
+        ]
+        return np.asarray(hits, dtype=np.int64)
@@ -0,0 +1,178 @@
+"""post_id -> cached row indexes (post, thread_summary, comment_context range, chunked documents)."""
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.utils.collection_meta import parent_doc_id
+
+
+def _first_chunk_rows(continued: List[Tuple[int, str]], post_row: np.ndarray, thread_row: np.ndarray) -> np.ndarray:
+    """Sorted rows of the first chunks of the (slot, type) documents that have more chunks."""
+    rows = set()
+    for slot, doc_type in continued:
+        row = post_row[slot] if doc_type == "post" else thread_row[slot] if doc_type == "thread_summary" else -1
+        if row >= 0:
+            rows.add(int(row))
+    return np.asarray(sorted(rows), dtype=np.int64)
+
+
+class PostLookup:
+    """
+    O(1) lookups built once at load time.
+
+    - ``post_row[i]`` / ``thread_row[i]``: row of ``post::<id>`` / ``thread_summary::<id>`` (-1 if absent;
+      for a chunked document, its first chunk)
+    - ``ctx_rows[ctx_indptr[i]:ctx_indptr[i + 1]]``: rows of that post's comment_context docs
+    - ``chunked_rows``: sorted rows of first chunks whose document has more chunks
+    where ``i = index[post_id]`` and ``post_ids[i]`` is the post id.
+    """
+
+    def __init__(
+        self,
+        post_ids: Sequence[str],
+        post_row: np.ndarray,
+        thread_row: np.ndarray,
+        ctx_indptr: np.ndarray,
+        ctx_rows: np.ndarray,
+        chunked_rows: np.ndarray,
+    ) -> None:
+        self.post_ids = post_ids
+        self.post_row = post_row
+        self.thread_row = thread_row
+        self.ctx_indptr = ctx_indptr
+        self.ctx_rows = ctx_rows
+        self.chunked_rows = chunked_rows
+        self.index = {pid: i for i, pid in enumerate(post_ids)}
+
+    @classmethod
+    def build(cls, doc_ids: Sequence[str], doc_sources: Sequence[Dict[str, Any]]) -> "PostLookup":
+        index: Dict[str, int] = {}
+        post_row: list = []
+        thread_row: list = []
+        ctx_post: list = []
+        ctx_row: list = []
+        continued: list = []  # (slot, type) của document có chunk thứ 2 trở đi
+
+        def slot(pid: str) -> int:
+            if pid not in index:
+                index[pid] = len(post_row)
+                post_row.append(-1)
+                thread_row.append(-1)
+            return index[pid]
+
+        for row, (doc_id, source) in enumerate(zip(doc_ids, doc_sources)):
+            doc_type = doc_id.split("::", 1)[0]
+            pid = (source or {}).get("post_id")
+            if not pid:
+                continue
+            pid = str(pid)
+            # Post / thread dài: chỉ chunk đầu (giữ doc_id gốc) đại diện cho document
+            if parent_doc_id(doc_id) != doc_id:
+                continued.append((slot(pid), doc_type))
+            elif doc_type == "post":
+                post_row[slot(pid)] = row
+            elif doc_type == "thread_summary":
+                thread_row[slot(pid)] = row
+            elif doc_type == "comment_context":
+                ctx_post.append(slot(pid))
+                ctx_row.append(row)
+
+        post_arr = np.asarray(post_row, dtype=np.int64)
+        thread_arr = np.asarray(thread_row, dtype=np.int64)
+        return cls._pack(
+            list(index.keys()),
+            post_arr,
+            thread_arr,
+            np.asarray(ctx_post, dtype=np.int64),
+            np.asarray(ctx_row, dtype=np.int64),
+            _first_chunk_rows(continued, post_arr, thread_arr),
+        )
+
+    @classmethod
+    def _pack(
+        cls,
+        post_ids: List[str],
+        post_row: np.ndarray,
+        thread_row: np.ndarray,
+        ctx_post: np.ndarray,
+        ctx_row: np.ndarray,
+        chunked_rows: np.ndarray,
+    ) -> "PostLookup":
+        n_posts = len(post_ids)
+        order = np.argsort(ctx_post, kind="stable")
+        ctx_indptr = np.zeros(n_posts + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ctx_post, minlength=n_posts), out=ctx_indptr[1:])
+        return cls(post_ids, post_row, thread_row, ctx_indptr, ctx_row[order], chunked_rows)
+
+    def with_rows(self, rows: Iterable[Tuple[int, str, Dict[str, Any]]]) -> "PostLookup":
+        """Copy with extra ``(row, doc_id, source)`` documents registered (rows appended by a delta)."""
+        index = dict(self.index)
+        post_ids = list(self.post_ids)
+        added = []
+        continued = []
+        for row, doc_id, source in rows:
+            pid = (source or {}).get("post_id")
+            if not pid:
+                continue
+            pid = str(pid)
+            if pid not in index:
+                index[pid] = len(post_ids)
+                post_ids.append(pid)
+            if parent_doc_id(doc_id) != doc_id:
+                continued.append((index[pid], doc_id.split("::", 1)[0]))
+            else:
+                added.append((index[pid], doc_id.split("::", 1)[0], row))
+
+        n_old = len(self.post_ids)
+        post_row = np.full(len(post_ids), -1, dtype=np.int64)
+        thread_row = np.full(len(post_ids), -1, dtype=np.int64)
+        post_row[:n_old] = self.post_row
+        thread_row[:n_old] = self.thread_row
+        ctx_post: list = []
+        ctx_row: list = []
+        for slot, doc_type, row in added:
+            if doc_type == "post":
+                post_row[slot] = row
+            elif doc_type == "thread_summary":
+                thread_row[slot] = row
+            elif doc_type == "comment_context":
+                ctx_post.append(slot)
+                ctx_row.append(row)
+        return self._pack(
+            post_ids,
+            post_row,
+            thread_row,
+            np.concatenate([
+                np.repeat(np.arange(n_old, dtype=np.int64), np.diff(self.ctx_indptr)),
+                np.asarray(ctx_post, dtype=np.int64),
+            ]),
+            np.concatenate([np.asarray(self.ctx_rows, dtype=np.int64), np.asarray(ctx_row, dtype=np.int64)]),
+            np.union1d(self.chunked_rows, _first_chunk_rows(continued, post_row, thread_row)),
+        )
+
+    def _get(self, arr: np.ndarray, post_id: str) -> Optional[int]:
+        i = self.index.get(str(post_id))
+        if i is None or arr[i] < 0:
+            return None
+        return int(arr[i])
+
+    def is_chunked(self, row: int) -> bool:
+        """True if ``row`` is the first chunk of a document split into several chunks."""
+        i = int(np.searchsorted(self.chunked_rows, row))
+        return i < len(self.chunked_rows) and int(self.chunked_rows[i]) == row
+
+    def post(self, post_id: str) -> Optional[int]:
+        """Row of the post document, or None."""
+        return self._get(self.post_row, post_id)
+
+    def thread_summary(self, post_id: str) -> Optional[int]:
+        """Row of the thread_summary document, or None."""
+        return self._get(self.thread_row, post_id)
+
+    def comment_contexts(self, post_id: str) -> np.ndarray:
+        """Rows of the post's comment_context documents (possibly empty)."""
+        i = self.index.get(str(post_id))
+        if i is None:
+            return np.empty(0, dtype=np.int64)
+        return np.asarray(self.ctx_rows[self.ctx_indptr[i] : self.ctx_indptr[i + 1]])
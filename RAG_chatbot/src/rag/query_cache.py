@@ -0,0 +1,203 @@
+"""Bounded LRU caches: BGE-M3 query encodings (dense + sparse, optionally backed by SQLite) and a generic in-memory LRU."""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+QueryEncoding = Tuple[np.ndarray, Optional[Dict[int, float]]]
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """NFC + trim + collapse whitespace (không lowercase: BGE-M3 phân biệt hoa/thường)."""
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFC", query or "")).strip()
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU map holding at most ``max_size`` entries."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max(0, int(max_size))
+        self._entries: "OrderedDict[Any, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Any, value: Any) -> None:
+        if self.max_size == 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class QueryEmbeddingCache:
+    """
+    Thread-safe LRU map: normalized query -> (dense vector, sparse weights).
+
+    Entries are tied to one ``model_name``; switching model clears the cache (RAM and disk).
+    With ``path`` set, entries are also written to a SQLite file so they survive restarts;
+    the file keeps at most ``disk_max_entries`` rows (least recently used are pruned).
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        max_size: int = 1024,
+        path: Optional[str] = None,
+        disk_max_entries: int = 100_000,
+    ) -> None:
+        self.max_size = max(0, int(max_size))
+        self.disk_max_entries = max(1, int(disk_max_entries))
+        self.hits = 0
+        self.misses = 0
+        self._model_name = model_name
+        self._entries: "OrderedDict[str, QueryEncoding]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._disk_writes = 0
+        if path:
+            self._open_db(Path(path))
+
+    # ----- disk backing -----
+
+    def _open_db(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS queries ("
+            "key TEXT PRIMARY KEY, dense BLOB NOT NULL, sparse TEXT, last_used REAL NOT NULL)"
+        )
+        row = self._db.execute("SELECT v FROM meta WHERE k = 'model_name'").fetchone()
+        if row is None or row[0] != self._model_name:
+            self._reset_db()
+        self._db.commit()
+
+    def _reset_db(self) -> None:
+        assert self._db is not None
+        self._db.execute("DELETE FROM queries")
+        self._db.execute(
+            "INSERT OR REPLACE INTO meta (k, v) VALUES ('model_name', ?)", (self._model_name,)
+        )
+
+    def _disk_get(self, key: str) -> Optional[QueryEncoding]:
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT dense, sparse FROM queries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._db.execute("UPDATE queries SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._db.commit()
+        dense = np.frombuffer(row[0], dtype=np.float32).copy()
+        sparse = None
+        if row[1] is not None:
+            sparse = {int(k): float(v) for k, v in json.loads(row[1]).items()}
+        return dense, sparse
+
+    def _disk_put(self, key: str, value: QueryEncoding) -> None:
+        if self._db is None:
+            return
+        dense, sparse = value
+        self._db.execute(
+            "INSERT OR REPLACE INTO queries (key, dense, sparse, last_used) VALUES (?, ?, ?, ?)",
+            (
+                key,
+                np.asarray(dense, dtype=np.float32).tobytes(),
+                json.dumps(sparse) if sparse is not None else None,
+                time.time(),
+            ),
+        )
+        self._disk_writes += 1
+        if self._disk_writes % 256 == 0:
+            self._db.execute(
+                "DELETE FROM queries WHERE key NOT IN "
+                "(SELECT key FROM queries ORDER BY last_used DESC LIMIT ?)",
+                (self.disk_max_entries,),
+            )
+        self._db.commit()
+
+    # ----- public API -----
+
+    @property
+    def model_name(self) -> str:
+        return self._model_name
+
+    @model_name.setter
+    def model_name(self, name: str) -> None:
+        """Switching model invalidates every cached encoding."""
+        with self._lock:
+            if name == self._model_name:
+                return
+            self._model_name = name
+            self._entries.clear()
+            if self._db is not None:
+                self._reset_db()
+                self._db.commit()
+
+    def get(self, key: str) -> Optional[QueryEncoding]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            value = self._disk_get(key)
+            if value is not None:
+                self._remember(key, value)
+                self.hits += 1
+                return value
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: QueryEncoding) -> None:
+        with self._lock:
+            self._remember(key, value)
+            self._disk_put(key, value)
+
+    def _remember(self, key: str, value: QueryEncoding) -> None:
+        if self.max_size == 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM queries")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "model_name": self._model_name,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "disk": self._db is not None,
+            }
@@ -1,32 +1,75 @@
 """RAG retriever implementation using BGE-M3 with hybrid search."""
 
 import re
-from typing import Any, Dict, List, Optional, Tuple
+import threading
+from collections import ChainMap
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import numpy as np
 from FlagEmbedding import BGEM3FlagModel
-from src.utils.config import get_qdrant_client, QDRANT_COLLECTION_NAME
+from qdrant_client.http.models import FieldCondition, Filter, MatchAny, Range
+from src.utils.collection_meta import doc_point_id, get_collection_version, parent_doc_id
+from src.utils.config import get_qdrant_client, QDRANT_COLLECTION_NAME, RETRIEVER_SNAPSHOT_DIR
+from src.utils.vectors import dense_vector, sparse_vector, uses_named_vectors, vector_selector
 
+from .ann_index import IVFIndex
+from .batching import MicroBatcher
+from .patched import PatchedList
+from .phrase_index import PhraseIndex
+from .post_lookup import PostLookup
+from .query_cache import LRUCache, QueryEmbeddingCache, normalize_query
+from .snapshot import load_snapshot, save_snapshot
+from .sparse_index import SparseIndex, SparseRow, clean_sparse_weights, sparse_row
 
-def _cosine_sim(a: np.ndarray, b: np.ndarray) -> np.ndarray:
-    """Calculate cosine similarity between vectors."""
-    if a.ndim == 1:
-        a = a[None, :]
-    a_norm = a / (np.linalg.norm(a, axis=1, keepdims=True) + 1e-8)
-    b_norm = b / (np.linalg.norm(b, axis=1, keepdims=True) + 1e-8)
-    return np.dot(a_norm, b_norm.T)
 
+# Số row mỗi lần upcast khi ma trận lưu float16 (numpy không có BLAS cho float16)
+_DOT_CHUNK_ROWS = 4096
+
+
+def _normalize_rows(mat: np.ndarray, dtype: Any = np.float32) -> np.ndarray:
+    """L2-normalize rows once (same epsilon as cosine sim) and store contiguously in dtype."""
+    mat = np.asarray(mat, dtype=np.float32)
+    if mat.ndim == 1:
+        mat = mat[None, :]
+    mat = mat / (np.linalg.norm(mat, axis=1, keepdims=True) + 1e-8)
+    return np.ascontiguousarray(mat, dtype=dtype)
+
+
+def _dense_scores_batch(normed: np.ndarray, q_vecs: np.ndarray) -> np.ndarray:
+    """Cosine similarity of B queries against pre-normalized rows (1 mat-mat) -> float32 (B, N)."""
+    q = _normalize_rows(q_vecs)
+    if normed.dtype == np.float32:
+        return q @ normed.T
+    out = np.empty((q.shape[0], normed.shape[0]), dtype=np.float32)
+    for start in range(0, normed.shape[0], _DOT_CHUNK_ROWS):
+        chunk = normed[start : start + _DOT_CHUNK_ROWS]
+        out[:, start : start + chunk.shape[0]] = q @ chunk.astype(np.float32).T
+    return out
 
-def _sparse_sim(query_sparse: Dict[int, float], doc_sparse: Dict[int, float]) -> float:
-    """Calculate sparse similarity (BM25-like) between query and document."""
-    if not query_sparse or not doc_sparse:
-        return 0.0
-    score = 0.0
-    for token_id, weight in query_sparse.items():
-        doc_weight = doc_sparse.get(token_id)
-        if doc_weight is not None:
-            score += weight * doc_weight
-    return float(score)
+
+def _dense_scores(normed: np.ndarray, q_vec: np.ndarray) -> np.ndarray:
+    """Cosine similarity of one query against pre-normalized rows -> float32 (N,)."""
+    return _dense_scores_batch(normed, q_vec)[0]
+
+
+def _top_k_indices(
+    scores: np.ndarray,
+    k: int,
+    candidates: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Indices of the k highest scores (descending) via argpartition: O(N + k log k)."""
+    pool = scores if candidates is None else scores[candidates]
+    n = pool.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= n:
+        order = np.argsort(-pool)
+    else:
+        part = np.argpartition(-pool, k - 1)[:k]
+        order = part[np.argsort(-pool[part])]
+    return order if candidates is None else candidates[order]
 
 
 def _is_nonzero_vector(vec: Any) -> bool:
@@ -44,18 +87,182 @@ def _is_nonzero_vector(vec: Any) -> bool:
 # Types used for retrieval (post + comment_context + thread_summary để match câu hỏi kiểu "review thầy X")
 RETRIEVAL_TYPES = ["post", "comment_context", "thread_summary"]
 
+# Chỉ lấy các payload field thực sự dùng (giảm dữ liệu truyền về lúc khởi động);
+# "sparse_embedding" chỉ có ở collection layout cũ (layout named dùng sparse vector gốc của Qdrant)
+RETRIEVAL_PAYLOAD_FIELDS = ["doc_id", "text", "source", "sparse_embedding", "updated_at", "deleted"]
+COMMENT_PAYLOAD_FIELDS = ["text", "source", "created_time", "updated_at", "deleted"]
+
+# refresh(): lấy lại cả các point có updated_at hơi cũ hơn mốc (ghi trễ giữa các job);
+# áp lại 1 point đã có là idempotent (ghép theo doc_id / comment_id)
+_SYNC_LOOKBACK_S = 120.0
+# Delta chạm >= tỉ lệ này của corpus thì reload toàn bộ thay vì patch
+_FULL_RELOAD_FRACTION = 0.5
+
+# Post / thread dài được index thành nhiều chunk: điểm của document = điểm chunk tốt nhất
+# + CHUNK_SCORE_WEIGHT x điểm của tối đa CHUNK_SCORE_MAX_EXTRA chunk khác cùng document trong pool
+CHUNK_SCORE_WEIGHT = 0.1
+CHUNK_SCORE_MAX_EXTRA = 2
+# Số full_text của document đã chia chunk giữ trong RAM (LRU, lấy lại từ Qdrant khi bị đẩy ra)
+FULL_TEXT_CACHE_SIZE = 256
+
+
+def _type_condition(types: List[str]) -> FieldCondition:
+    return FieldCondition(key="type", match=MatchAny(any=list(types)))
+
+
+def _type_filter(types: List[str]) -> Filter:
+    """Server-side filter on payload ``type`` (backed by the keyword index from index_mongo.py)."""
+    return Filter(must=[_type_condition(types)])
+
+
+def _updated_at(payload: Dict[str, Any]) -> float:
+    """Payload ``updated_at`` (epoch seconds, written by index_mongo/embed_bge_m3), 0 if missing."""
+    try:
+        return float(payload.get("updated_at") or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class _RetrievalRows:
+    """Compact per-row accumulators filled while streaming retrieval points."""
+
+    def __init__(self, keep_sparse: bool = True) -> None:
+        self.keep_sparse = keep_sparse
+        self.seen = 0
+        self.synced_at = 0.0
+        self.point_ids: List[Any] = []
+        self.doc_ids: List[str] = []
+        self.texts: List[str] = []
+        self.sources: List[Dict[str, Any]] = []
+        self.vectors: List[np.ndarray] = []
+        self.sparse: List[Optional[SparseRow]] = []
+        self.updated_at: List[float] = []
+        # doc_id của các point đã tombstone (index_mongo.py: nguồn bị xóa)
+        self.deleted_doc_ids: List[str] = []
+
+    def add(self, point: Any) -> None:
+        self.seen += 1
+        payload = point.payload or {}
+        updated_at = _updated_at(payload)
+        self.synced_at = max(self.synced_at, updated_at)
+        if payload.get("deleted"):
+            self.deleted_doc_ids.append(str(payload.get("doc_id", "")))
+            return
+        vector = dense_vector(point.vector)
+        if not _is_nonzero_vector(vector):
+            return
+        self.updated_at.append(updated_at)
+        self.point_ids.append(point.id)
+        self.doc_ids.append(str(payload.get("doc_id", "")))
+        self.texts.append(str(payload.get("text", "")))
+        self.sources.append(dict(payload.get("source", {}) or {}))
+        self.vectors.append(np.asarray(vector, dtype=np.float32))
+        if self.keep_sparse:
+            # Layout named: sparse vector gốc (lấy nguyên mảng); layout cũ: dict trong payload
+            native = sparse_vector(point.vector)
+            self.sparse.append(sparse_row(native if native is not None else payload.get("sparse_embedding")))
+
+    def drop_known(self, row_of: Dict[str, int], synced_at: float) -> None:
+        """Drop rows already cached at the last sync (re-fetched only because of the lookback)."""
+        keep = [
+            j for j, doc_id in enumerate(self.doc_ids)
+            if doc_id not in row_of or self.updated_at[j] > synced_at
+        ]
+        if len(keep) == len(self.doc_ids):
+            return
+        for name in ("point_ids", "doc_ids", "texts", "sources", "vectors", "sparse", "updated_at"):
+            values = getattr(self, name)
+            if values:
+                setattr(self, name, [values[j] for j in keep])
+
+
+def _comment_entry(point: Any) -> Tuple[Optional[str], Dict[str, Any]]:
+    """(post_id, comment dict) of one type=comment point; post_id is None for orphans."""
+    payload = point.payload or {}
+    source = payload.get("source", {}) or {}
+    post_id = source.get("post_id")
+    return (str(post_id) if post_id else None), {
+        "text": str(payload.get("text", "")).strip(),
+        "comment_id": source.get("comment_id"),
+        "created_time": payload.get("created_time"),
+    }
+
+
+def _add_comment(comments_by_post: Dict[str, List[Dict[str, Any]]], point: Any) -> None:
+    """Append one type=comment point to the post_id -> comments map (tombstones are skipped)."""
+    post_id, entry = _comment_entry(point)
+    if post_id and not (point.payload or {}).get("deleted"):
+        comments_by_post.setdefault(post_id, []).append(entry)
+
+
+def _has_comment(comments_by_post: Mapping, point: Any) -> bool:
+    """True if the comment of this point is already in the post_id -> comments map."""
+    post_id, entry = _comment_entry(point)
+    return any(c.get("comment_id") == entry["comment_id"] for c in comments_by_post.get(post_id, []))
+
 
 def _extract_quoted_phrases(query: str) -> List[str]:
     """Lấy các cụm trong ngoặc kép từ query (exact phrase)."""
     return [m.strip().lower() for m in re.findall(r'"([^"]+)"', query) if m.strip()]
 
 
+class _CacheState:
+    """
+    Everything a query reads, swapped as one unit.
+
+    ``refresh()`` builds a new state next to the live one (copy-on-write) and replaces
+    ``RAGRetriever._state`` with a single assignment; a request keeps the state it started
+    with, so it never sees the dense matrix of one version and doc_ids of another.
+    """
+
+    def __init__(
+        self,
+        *,
+        version: Optional[str],
+        synced_at: float,
+        point_ids: Sequence,
+        doc_ids: Sequence,
+        doc_texts: Sequence,
+        doc_sources: Sequence,
+        embeddings: np.ndarray,
+        sparse_index: Optional[SparseIndex],
+        phrase_index: PhraseIndex,
+        post_lookup: PostLookup,
+        comments_by_post: Mapping,
+        ann_index: Optional[IVFIndex] = None,
+    ) -> None:
+        self.version = version
+        self.synced_at = float(synced_at)
+        self.point_ids = point_ids
+        self.doc_ids = doc_ids
+        self.doc_texts = doc_texts
+        self.doc_sources = doc_sources
+        self.embeddings = embeddings
+        self.sparse_index = sparse_index
+        self.phrase_index = phrase_index
+        self.post_lookup = post_lookup
+        self.comments_by_post = comments_by_post
+        self.ann_index = ann_index
+        self.rows_by_doc_id: Optional[Dict[str, int]] = None
+
+    @property
+    def n_docs(self) -> int:
+        return int(self.embeddings.shape[0])
+
+    def row_of(self) -> Dict[str, int]:
+        """doc_id -> row (built on the first delta, then carried over to later states)."""
+        if self.rows_by_doc_id is None:
+            self.rows_by_doc_id = {str(d): i for i, d in enumerate(self.doc_ids)}
+        return self.rows_by_doc_id
+
+
 class RAGRetriever:
     """
     RAG retriever using BGE-M3 with hybrid search (dense + sparse).
 
     - Retrieval: post, comment_context, thread_summary (để match nội dung review trong comment/thread).
     - Comments (type=comment) chỉ dùng để enrich context sau khi đã chọn post.
+    - ``refresh()`` (hoặc ``refresh_interval_s`` > 0) nạp point mới/đổi mà không cần restart.
     """
 
     def __init__(
@@ -69,12 +276,36 @@ class RAGRetriever:
         comment_limit: int = 8,
         model_name: str = "BAAI/bge-m3",
         use_fp16: bool = True,
+        embedding_dtype: str = "float32",
+        overfetch: int = 4,
+        use_snapshot: bool = True,
+        snapshot_dir: Optional[str] = None,
+        query_cache_size: int = 1024,
+        query_cache_path: Optional[str] = None,
+        batch_max_size: int = 1,
+        batch_max_wait_ms: float = 5.0,
+        use_ann: Optional[bool] = None,
+        ann_min_docs: int = 50_000,
+        ann_nprobe: int = 16,
+        ann_candidates: int = 512,
+        refresh_interval_s: float = 0.0,
     ) -> None:
         self.collection_name = collection_name or QDRANT_COLLECTION_NAME
         self.top_k = top_k
         self.min_score = min_score
         self.use_hybrid = use_hybrid
         self.comment_limit = comment_limit
+        # float16 giảm 1/2 RAM cho ma trận dense, đổi lại phải upcast từng chunk khi tính điểm
+        self.embedding_dtype = np.dtype(embedding_dtype)
+        # Lấy dư top_k * overfetch ứng viên trước khi dedup theo post_id
+        self.overfetch = max(1, int(overfetch))
+        self.use_snapshot = use_snapshot
+        # ANN (IVF) cho dense: None = tự bật khi corpus >= ann_min_docs; corpus nhỏ dùng brute force
+        self.use_ann = use_ann
+        self.ann_min_docs = ann_min_docs
+        self.ann_nprobe = ann_nprobe
+        self.ann_candidates = ann_candidates
+        self.snapshot_path = Path(snapshot_dir or RETRIEVER_SNAPSHOT_DIR) / self.collection_name
 
         total_weight = dense_weight + sparse_weight
         if total_weight <= 0:
@@ -85,23 +316,169 @@ class RAGRetriever:
             self.sparse_weight = sparse_weight / total_weight
 
         self.qdrant_client = get_qdrant_client()
+        self.model_name = model_name
         self.model = BGEM3FlagModel(model_name, use_fp16=use_fp16)
+        # LRU cache cho câu hỏi lặp lại (0 + không có path = tắt)
+        self.full_text_cache = LRUCache(FULL_TEXT_CACHE_SIZE)
+        self.query_cache: Optional[QueryEmbeddingCache] = None
+        if query_cache_size > 0 or query_cache_path:
+            self.query_cache = QueryEmbeddingCache(model_name, max_size=query_cache_size, path=query_cache_path)
+        # Micro-batching: gom query từ nhiều thread (vd. /api/chat) thành 1 lần encode + 1 mat-mat
+        self.batcher: Optional[MicroBatcher] = None
+        if batch_max_size > 1:
+            self.batcher = MicroBatcher(
+                self._encode_and_score_batch,
+                max_batch_size=batch_max_size,
+                max_wait_ms=batch_max_wait_ms,
+                name="rag-query-batcher",
+            )
+
+        self._refresh_lock = threading.Lock()
+        self._refresh_stop = threading.Event()
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._state = self._load_state()
+        if refresh_interval_s > 0:
+            self.start_auto_refresh(refresh_interval_s)
+
+    # Views of the live state (đọc 1 lần/request qua self._state khi cần nhất quán)
+    @property
+    def embeddings(self) -> np.ndarray:
+        return self._state.embeddings
+
+    @property
+    def doc_ids(self) -> Sequence:
+        return self._state.doc_ids
+
+    @property
+    def doc_texts(self) -> Sequence:
+        return self._state.doc_texts
+
+    @property
+    def doc_sources(self) -> Sequence:
+        return self._state.doc_sources
+
+    @property
+    def comments_by_post(self) -> Mapping:
+        return self._state.comments_by_post
+
+    def _load_state(self) -> _CacheState:
+        """Restore caches from the mmap snapshot, or rebuild from Qdrant and write a new one."""
+        version = get_collection_version(self.qdrant_client, self.collection_name)
+        snap = load_snapshot(self.snapshot_path, version) if self.use_snapshot else None
+        if snap is not None and self._snapshot_compatible(snap["meta"]):
+            state = self._state_from_snapshot(snap)
+            meta = snap["meta"]
+            print("RAGRetriever v2 loaded from snapshot (mmap).")
+            print(f"  Collection: {self.collection_name} (version {meta['collection_version']})")
+            print(f"  Snapshot: {self.snapshot_path}")
+            print(f"  Retrieval points: {meta['n_docs']} (post + comment_context + thread_summary)")
+            print(f"  Dense: {meta['n_docs']} ({meta['dtype']}, normalized)")
+            if state.sparse_index is not None:
+                print(f"  Sparse: nnz={state.sparse_index.nnz}")
+            print(f"Loaded {meta['n_comments']} comments for {meta['n_comment_posts']} posts.")
+        else:
+            # Lấy version TRƯỚC khi scroll: nếu collection đổi giữa chừng, lần refresh/khởi động sau sẽ bắt kịp
+            state = self._load_collection(version)
+            self._save_snapshot(state)
+        state.ann_index = self._init_ann(state, persist=True)
+        return state
+
+    def _save_snapshot(self, state: _CacheState) -> bool:
+        """Persist state as the mmap snapshot (no-op when snapshots are off); True if written."""
+        if not self.use_snapshot or state.version is None:
+            return False
+        try:
+            save_snapshot(
+                self.snapshot_path,
+                collection_version=state.version,
+                embeddings=state.embeddings,
+                point_ids=state.point_ids,
+                doc_ids=state.doc_ids,
+                doc_texts=state.doc_texts,
+                doc_sources=state.doc_sources,
+                sparse_index=state.sparse_index,
+                phrase_index=state.phrase_index,
+                post_lookup=state.post_lookup,
+                comments_by_post=state.comments_by_post,
+                synced_at=state.synced_at,
+            )
+        except OSError as e:
+            print(f"Warning: could not write retriever snapshot: {e}")
+            return False
+        print(f"Saved retriever snapshot to {self.snapshot_path} (version {state.version}).")
+        return True
+
+    def _init_ann(self, state: _CacheState, persist: bool) -> Optional[IVFIndex]:
+        """Load or build the IVF index when enabled (auto: corpus >= ann_min_docs)."""
+        n_docs = state.n_docs
+        enabled = self.use_ann if self.use_ann is not None else n_docs >= self.ann_min_docs
+        if not enabled or n_docs <= self.ann_candidates:
+            return None
+
+        ann_path = self.snapshot_path / "ann_ivf"
+        persist = persist and self.use_snapshot and state.version is not None
+        if persist:
+            ann_index = IVFIndex.load(ann_path, {"n_docs": n_docs, "collection_version": state.version})
+            if ann_index is not None:
+                print(f"  ANN: IVF loaded ({ann_index.n_lists} lists, nprobe={self.ann_nprobe})")
+                return ann_index
 
-        self._load_embeddings_cache()
-        self._load_comments_cache()
+        print(f"  ANN: building IVF index over {n_docs} vectors...")
+        ann_index = IVFIndex.build(state.embeddings)
+        # Recall@10 so với brute force, dùng các vector tài liệu lấy mẫu làm query
+        rng = np.random.default_rng(0)
+        sample = rng.choice(n_docs, size=min(50, n_docs), replace=False)
+        queries = _normalize_rows(np.asarray(state.embeddings[np.sort(sample)]))
+        recall = ann_index.recall_at_k(
+            state.embeddings, queries, k=10, nprobe=self.ann_nprobe, n_candidates=self.ann_candidates
+        )
+        print(
+            f"  ANN: IVF {ann_index.n_lists} lists, nprobe={self.ann_nprobe}, "
+            f"candidates={self.ann_candidates}, recall@10 vs brute force={recall:.3f}"
+        )
+        if persist:
+            try:
+                ann_index.save(ann_path, {"collection_version": state.version, "recall_at_10": recall})
+            except OSError as e:
+                print(f"Warning: could not persist ANN index: {e}")
+        return ann_index
 
-    def _scroll_all_points(
+    def _snapshot_compatible(self, meta: Dict[str, Any]) -> bool:
+        """Snapshot must use the same dense dtype and carry sparse weights if hybrid is on."""
+        if meta.get("dtype") != str(self.embedding_dtype):
+            return False
+        return bool(meta.get("has_sparse")) or not self.use_hybrid
+
+    def _state_from_snapshot(self, snap: Dict[str, Any]) -> _CacheState:
+        """Point a new state at the memory-mapped snapshot arrays."""
+        meta = snap["meta"]
+        return _CacheState(
+            version=meta["collection_version"],
+            synced_at=meta.get("synced_at", 0.0),
+            point_ids=snap["point_ids"],
+            doc_ids=snap["doc_ids"],
+            doc_texts=snap["doc_texts"],
+            doc_sources=snap["doc_sources"],
+            embeddings=snap["embeddings"],
+            sparse_index=snap["sparse_index"] if self.use_hybrid else None,
+            phrase_index=snap["phrase_index"],
+            post_lookup=snap["post_lookup"],
+            comments_by_post=snap["comments_by_post"],
+        )
+
+    def _iter_points(
         self,
-        with_payload: bool = True,
-        with_vectors: bool = False,
+        with_payload: Any = True,
+        with_vectors: Any = False,
         batch_size: int = 1000,
-    ) -> List[Any]:
-        """Scroll all points from Qdrant with pagination (no payload filter — Qdrant Cloud cần index)."""
-        all_points: List[Any] = []
+        scroll_filter: Optional[Filter] = None,
+    ) -> Iterator[Any]:
+        """Stream points from Qdrant page by page (optionally filtered server-side)."""
         offset = None
         while True:
             points, offset = self.qdrant_client.scroll(
                 collection_name=self.collection_name,
+                scroll_filter=scroll_filter,
                 limit=batch_size,
                 with_payload=with_payload,
                 with_vectors=with_vectors,
@@ -109,109 +486,369 @@ class RAGRetriever:
             )
             if not points:
                 break
-            all_points.extend(points)
+            yield from points
             if offset is None:
                 break
-        return all_points
 
-    def _load_embeddings_cache(self) -> None:
-        """Load embeddings for retrieval (post + comment_context + thread_summary) into RAM."""
-        points = self._scroll_all_points(with_payload=True, with_vectors=True)
+    def _retrieval_selectors(self) -> Tuple[List[str], Any]:
+        """(payload fields, with_vectors) of retrieval points for the collection's vector layout."""
+        named = uses_named_vectors(self.qdrant_client, self.collection_name)
+        fields = [
+            f for f in RETRIEVAL_PAYLOAD_FIELDS
+            if f != "sparse_embedding" or (self.use_hybrid and not named)
+        ]
+        return fields, vector_selector(named, self.use_hybrid)
+
+    def _load_collection(self, version: Optional[str]) -> _CacheState:
+        """
+        Load retrieval embeddings and comments from Qdrant.
 
-        if not points:
+        Dùng filter theo payload ``type`` (cần payload index do index_mongo.py tạo): chỉ lấy vector
+        cho RETRIEVAL_TYPES và chỉ các field cần thiết. Nếu server từ chối filter (collection cũ
+        chưa có index) thì quét 1 lượt duy nhất và phân loại trong Python.
+        """
+        retrieval_fields, with_vectors = self._retrieval_selectors()
+        rows = _RetrievalRows(keep_sparse=self.use_hybrid)
+        comments: Dict[str, List[Dict[str, Any]]] = {}
+        synced_at = 0.0
+        try:
+            for p in self._iter_points(
+                retrieval_fields, with_vectors, scroll_filter=_type_filter(RETRIEVAL_TYPES)
+            ):
+                rows.add(p)
+            for p in self._iter_points(
+                COMMENT_PAYLOAD_FIELDS, False, scroll_filter=_type_filter(["comment"])
+            ):
+                _add_comment(comments, p)
+                synced_at = max(synced_at, _updated_at(p.payload or {}))
+        except Exception as e:
+            print(f"Warning: filtered scroll failed ({e}); falling back to a single unfiltered pass.")
+            rows = _RetrievalRows(keep_sparse=self.use_hybrid)
+            comments = {}
+            synced_at = 0.0
+            fields = sorted(set(retrieval_fields) | set(COMMENT_PAYLOAD_FIELDS) | {"type"})
+            for p in self._iter_points(fields, with_vectors):
+                point_type = (p.payload or {}).get("type")
+                if point_type in RETRIEVAL_TYPES:
+                    rows.add(p)
+                elif point_type == "comment":
+                    _add_comment(comments, p)
+                    synced_at = max(synced_at, _updated_at(p.payload or {}))
+
+        state = self._build_state(rows, comments, version, max(synced_at, rows.synced_at))
+        total = sum(len(v) for v in comments.values())
+        print(f"Loaded {total} comments for {len(comments)} posts.")
+        return state
+
+    def _build_state(
+        self,
+        rows: "_RetrievalRows",
+        comments: Dict[str, List[Dict[str, Any]]],
+        version: Optional[str],
+        synced_at: float,
+    ) -> _CacheState:
+        """Turn streamed retrieval rows (post + comment_context + thread_summary) into the RAM caches."""
+        if rows.seen == 0:
             raise RuntimeError(
                 f"No points found in Qdrant collection '{self.collection_name}'. "
                 "Run scripts/index_mongo.py and scripts/embed_bge_m3.py first."
             )
-
-        valid_points = []
-        for p in points:
-            payload = p.payload or {}
-            if payload.get("type") not in RETRIEVAL_TYPES:
-                continue
-            if not _is_nonzero_vector(p.vector):
-                continue
-            valid_points.append(p)
-
-        if not valid_points:
+        if not rows.vectors:
             raise RuntimeError(
-                f"Found {len(points)} points but none have valid embeddings. "
+                f"Found {rows.seen} points but none have valid embeddings. "
                 "Run scripts/embed_bge_m3.py to generate embeddings."
             )
 
-        self.point_ids = [int(p.id) for p in valid_points]
-        self.doc_ids = [str((p.payload or {}).get("doc_id", "")) for p in valid_points]
-        self.doc_texts = [str((p.payload or {}).get("text", "")) for p in valid_points]
-        self.doc_sources = [dict((p.payload or {}).get("source", {}) or {}) for p in valid_points]
+        # Chuẩn hóa 1 lần lúc load -> mỗi query chỉ còn 1 mat-vec
+        embeddings = _normalize_rows(np.stack(rows.vectors, axis=0), self.embedding_dtype)
+        rows.vectors = []
 
-        emb_list = [np.asarray(p.vector, dtype=np.float32) for p in valid_points]
-        self.embeddings = np.stack(emb_list, axis=0)
-
-        self.sparse_embeddings: List[Dict[int, float]] = []
+        # Sparse weights packed into one CSR matrix (token x doc) -> 1 sparse mat-vec per query
+        sparse_index: Optional[SparseIndex] = None
         if self.use_hybrid:
-            for p in valid_points:
-                sparse = (p.payload or {}).get("sparse_embedding")
-                if isinstance(sparse, dict) and sparse:
-                    cleaned = {}
-                    for k, v in sparse.items():
-                        try:
-                            cleaned[int(k)] = float(v)
-                        except (TypeError, ValueError):
-                            continue
-                    self.sparse_embeddings.append(cleaned)
-                else:
-                    self.sparse_embeddings.append({})
+            sparse_index = SparseIndex.from_rows(rows.sparse)
+        rows.sparse = []
+
+        state = _CacheState(
+            version=version,
+            synced_at=synced_at,
+            point_ids=rows.point_ids,
+            doc_ids=rows.doc_ids,
+            doc_texts=rows.texts,
+            doc_sources=rows.sources,
+            embeddings=embeddings,
+            sparse_index=sparse_index,
+            # Trigram index + text lowercase sẵn cho phrase boost "..." (không quét toàn bộ mỗi query)
+            phrase_index=PhraseIndex.build(rows.texts),
+            # post_id -> row của post / thread_summary / các comment_context (get_post_by_id O(1))
+            post_lookup=PostLookup.build(rows.doc_ids, rows.sources),
+            comments_by_post=comments,
+        )
 
         print("RAGRetriever v2 loaded.")
         print(f"  Collection: {self.collection_name}")
-        print(f"  Retrieval points: {len(self.doc_ids)} (post + comment_context + thread_summary)")
-        print(f"  Dense: {len(self.embeddings)}")
-        if self.use_hybrid:
-            n = sum(1 for s in self.sparse_embeddings if s)
-            print(f"  Sparse: {n}/{len(self.sparse_embeddings)}")
-
-    def _load_comments_cache(self) -> None:
-        """Load comments by post_id from Qdrant (lọc type=comment trong Python)."""
-        points = self._scroll_all_points(with_payload=True, with_vectors=False)
-
-        self.comments_by_post: Dict[str, List[Dict[str, Any]]] = {}
-        for point in points:
-            payload = point.payload or {}
-            source = payload.get("source", {}) or {}
-            if payload.get("type") != "comment":
-                continue
-            post_id = source.get("post_id")
+        print(f"  Retrieval points: {len(state.doc_ids)} (post + comment_context + thread_summary)")
+        print(f"  Dense: {state.n_docs} ({embeddings.dtype}, normalized)")
+        if sparse_index is not None:
+            n = sparse_index.docs_with_weights()
+            print(f"  Sparse: {n}/{sparse_index.n_docs} (nnz={sparse_index.nnz})")
+        return state
+
+    # ----- incremental refresh -----
+
+    def refresh(self) -> int:
+        """
+        Pull points written since the last sync and swap in updated caches.
+
+        Costs one point lookup when nothing changed (collection version unchanged). Otherwise
+        points with ``updated_at`` past the watermark are matched to cached rows by ``doc_id``
+        and patched into copies of the caches; requests keep serving the old state until the
+        swap. Returns the number of points applied, or -1 after a full reload.
+        """
+        with self._refresh_lock:
+            state = self._state
+            version = get_collection_version(self.qdrant_client, self.collection_name)
+            if version is None or version == state.version:
+                return 0
+
+            delta = None
+            if state.synced_at > 0:
+                try:
+                    delta = self._fetch_delta(state.synced_at - _SYNC_LOOKBACK_S)
+                except Exception as e:
+                    print(f"Warning: delta scroll failed ({e}); reloading the whole collection.")
+            if delta is not None:
+                delta[0].drop_known(state.row_of(), state.synced_at)
+                delta = (delta[0], [
+                    p for p in delta[1]
+                    if _updated_at(p.payload or {}) > state.synced_at
+                    or not _has_comment(state.comments_by_post, p)
+                ])
+                row_of = state.row_of()
+                if any(doc_id in row_of for doc_id in delta[0].deleted_doc_ids):
+                    # Xóa row khỏi mọi index (CSR, trigram, IVF) không đáng: tombstone hiếm -> reload
+                    print("Retrieval documents were tombstoned; reloading the whole collection.")
+                    delta = None
+            # Delta chạm gần hết corpus -> reload cũng rẻ như patch
+            if delta is None or len(delta[0].doc_ids) >= _FULL_RELOAD_FRACTION * state.n_docs:
+                self._state = self._load_state()
+                return -1
+
+            rows, comment_points = delta
+            new_state = self._apply_delta(state, rows, comment_points, version)
+            self._state = new_state
+            applied = len(rows.doc_ids) + len(comment_points)
+            print(
+                f"RAGRetriever refreshed to version {version}: {applied} changed points, "
+                f"{new_state.n_docs - state.n_docs} new retrieval docs (total {new_state.n_docs})."
+            )
+            self._persist_refreshed(new_state)
+            return applied
+
+    def _fetch_delta(self, since: float) -> Tuple["_RetrievalRows", List[Any]]:
+        """Retrieval rows and comment points with payload updated_at > since (server-side filter)."""
+        # Range filter cần payload index "updated_at" (float) do index_mongo.py tạo
+        changed = FieldCondition(key="updated_at", range=Range(gt=since))
+        retrieval_fields, with_vectors = self._retrieval_selectors()
+        rows = _RetrievalRows(keep_sparse=self.use_hybrid)
+        for p in self._iter_points(
+            retrieval_fields,
+            with_vectors,
+            scroll_filter=Filter(must=[_type_condition(RETRIEVAL_TYPES), changed]),
+        ):
+            rows.add(p)
+        comment_points = list(self._iter_points(
+            COMMENT_PAYLOAD_FIELDS,
+            False,
+            scroll_filter=Filter(must=[_type_condition(["comment"]), changed]),
+        ))
+        return rows, comment_points
+
+    def _apply_delta(
+        self,
+        state: _CacheState,
+        rows: "_RetrievalRows",
+        comment_points: List[Any],
+        version: str,
+    ) -> _CacheState:
+        """New state = state with changed rows replaced (same doc_id) and new rows appended."""
+        n_old = state.n_docs
+        row_of = dict(state.row_of())
+        target: Dict[int, int] = {}  # row -> index in rows.*
+        # Row mới đánh số từ n_old, không từ len(row_of): state có thể chứa doc_id trùng
+        # (point id cũ + bản UUID mới chưa bị _sweep) nên len(row_of) < n_old
+        n_new = n_old
+        for j, doc_id in enumerate(rows.doc_ids):
+            row = row_of.get(doc_id)
+            if row is None:
+                row = row_of[doc_id] = n_new
+                n_new += 1
+            target[row] = j
+        changed = np.fromiter(target.keys(), dtype=np.int64, count=len(target))
+
+        def patched(base: Sequence, values: List[Any]) -> Sequence:
+            if not target:
+                return base
+            return PatchedList(
+                base,
+                {r: values[j] for r, j in target.items() if r < n_old},
+                [values[target[r]] for r in range(n_old, n_new)],
+            )
+
+        embeddings = state.embeddings
+        if target:
+            vecs = _normalize_rows(np.stack(rows.vectors, axis=0), embeddings.dtype)
+            embeddings = np.empty((n_new, embeddings.shape[1]), dtype=embeddings.dtype)
+            embeddings[:n_old] = state.embeddings
+            embeddings[changed] = vecs[np.fromiter(target.values(), dtype=np.int64, count=len(target))]
+
+        sparse_index = state.sparse_index
+        if sparse_index is not None and target:
+            sparse_index = sparse_index.updated({r: rows.sparse[j] for r, j in target.items()}, n_new)
+
+        # Comment map: overlay các post có comment đổi lên map gốc (BlobMapping mmap không bị copy)
+        base = state.comments_by_post
+        overrides: Dict[str, List[Dict[str, Any]]] = {}
+        if isinstance(base, ChainMap):
+            overrides.update(base.maps[0])
+            base = base.maps[1]
+        for p in comment_points:
+            post_id, entry = _comment_entry(p)
             if not post_id:
                 continue
-            self.comments_by_post.setdefault(str(post_id), []).append({
-                "text": str(payload.get("text", "")).strip(),
-                "comment_id": source.get("comment_id"),
-                "created_time": payload.get("created_time"),
-            })
+            current = overrides[post_id] if post_id in overrides else list(base.get(post_id, []))
+            current = [c for c in current if c.get("comment_id") != entry["comment_id"]]
+            if not (p.payload or {}).get("deleted"):
+                current.append(entry)
+            overrides[post_id] = current
+
+        new_state = _CacheState(
+            version=version,
+            synced_at=max(state.synced_at, rows.synced_at, *(_updated_at(p.payload or {}) for p in comment_points)),
+            point_ids=patched(state.point_ids, rows.point_ids),
+            doc_ids=patched(state.doc_ids, rows.doc_ids),
+            doc_texts=patched(state.doc_texts, rows.texts),
+            doc_sources=patched(state.doc_sources, rows.sources),
+            embeddings=embeddings,
+            sparse_index=sparse_index,
+            phrase_index=state.phrase_index.updated({r: rows.texts[j] for r, j in target.items()})
+            if target else state.phrase_index,
+            post_lookup=state.post_lookup.with_rows(
+                (r, rows.doc_ids[target[r]], rows.sources[target[r]]) for r in range(n_old, n_new)
+            ) if n_new > n_old else state.post_lookup,
+            comments_by_post=ChainMap(overrides, base) if overrides else state.comments_by_post,
+        )
+        new_state.rows_by_doc_id = row_of
+        if state.ann_index is not None and target:
+            new_state.ann_index = state.ann_index.updated(embeddings, changed)
+        elif state.ann_index is not None:
+            new_state.ann_index = state.ann_index
+        else:
+            new_state.ann_index = self._init_ann(new_state, persist=False)
+        return new_state
+
+    def _persist_refreshed(self, state: _CacheState) -> None:
+        """Write the refreshed state as the new snapshot, then serve from its mmap (frees the RAM copy)."""
+        if not self._save_snapshot(state):
+            return
+        if state.ann_index is not None:
+            try:
+                state.ann_index.save(self.snapshot_path / "ann_ivf", {"collection_version": state.version})
+            except OSError as e:
+                print(f"Warning: could not persist ANN index: {e}")
+        snap = load_snapshot(self.snapshot_path, state.version)
+        if snap is None or self._state is not state:
+            return
+        mapped = self._state_from_snapshot(snap)
+        mapped.ann_index = state.ann_index
+        mapped.rows_by_doc_id = state.rows_by_doc_id
+        self._state = mapped
+
+    def start_auto_refresh(self, interval_s: float) -> None:
+        """Call refresh() every interval_s seconds from a daemon thread."""
+        if self._refresh_thread is not None:
+            return
+
+        def loop() -> None:
+            while not self._refresh_stop.wait(interval_s):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Warning: retriever refresh failed: {e}")
+
+        self._refresh_stop.clear()
+        self._refresh_thread = threading.Thread(target=loop, name="rag-retriever-refresh", daemon=True)
+        self._refresh_thread.start()
 
-        total = sum(len(v) for v in self.comments_by_post.values())
-        print(f"Loaded {total} comments for {len(self.comments_by_post)} posts.")
+    def stop_auto_refresh(self) -> None:
+        if self._refresh_thread is None:
+            return
+        self._refresh_stop.set()
+        self._refresh_thread.join()
+        self._refresh_thread = None
+
+    # ----- query path -----
+
+    def _encode_queries(self, queries: List[str]) -> List[Tuple[np.ndarray, Optional[Dict[int, float]]]]:
+        """Encode queries into dense and optional sparse; cache misses go through one model.encode call."""
+        texts = [normalize_query(q) for q in queries]
+        mode = "hybrid" if self.use_hybrid else "dense"
+        results: List[Optional[Tuple[np.ndarray, Optional[Dict[int, float]]]]] = [None] * len(texts)
+        if self.query_cache is not None:
+            for i, text in enumerate(texts):
+                results[i] = self.query_cache.get(f"{mode}|{text}")
+
+        # Trùng câu hỏi trong cùng batch chỉ encode 1 lần
+        missing = list(dict.fromkeys(t for t, r in zip(texts, results) if r is None))
+        if missing:
+            outputs = self.model.encode(
+                missing,
+                return_dense=True,
+                return_sparse=self.use_hybrid,
+                return_colbert_vecs=False,
+            )
+            sparse_vecs = outputs.get("sparse_vecs") if self.use_hybrid else None
+            encoded = {}
+            for j, text in enumerate(missing):
+                q_vec = np.asarray(outputs["dense_vecs"][j], dtype=np.float32)
+                q_sparse = None
+                if sparse_vecs is not None and isinstance(sparse_vecs[j], dict):
+                    q_sparse = clean_sparse_weights(sparse_vecs[j])
+                encoded[text] = (q_vec, q_sparse)
+                if self.query_cache is not None:
+                    self.query_cache.put(f"{mode}|{text}", encoded[text])
+            results = [r if r is not None else encoded[t] for t, r in zip(texts, results)]
+        return results  # type: ignore[return-value]
 
     def _encode_query(self, query: str) -> Tuple[np.ndarray, Optional[Dict[int, float]]]:
-        """Encode query into dense and optional sparse."""
-        outputs = self.model.encode(
-            [query],
-            return_dense=True,
-            return_sparse=self.use_hybrid,
-            return_colbert_vecs=False,
-        )
-        q_vec = np.asarray(outputs["dense_vecs"][0], dtype=np.float32)
-        q_sparse = None
-        if self.use_hybrid and outputs.get("sparse_vecs"):
-            raw = outputs["sparse_vecs"][0]
-            if isinstance(raw, dict):
-                q_sparse = {}
-                for k, v in raw.items():
-                    try:
-                        q_sparse[int(k)] = float(v)
-                    except (TypeError, ValueError):
-                        continue
-        return q_vec, q_sparse
+        """Encode query into dense and optional sparse (served from the LRU cache when possible)."""
+        return self._encode_queries([query])[0]
+
+    def _encode_and_score_batch(
+        self, queries: List[str]
+    ) -> List[Tuple[_CacheState, np.ndarray, Optional[Dict[int, float]], np.ndarray, Optional[np.ndarray]]]:
+        """
+        Encode a batch and score its dense side -> (state, q_vec, q_sparse, dense_sims, pool) per query.
+
+        Brute force: one matrix-matrix multiply, pool=None. With the ANN index, only the IVF
+        candidate pool gets an exact cosine (other rows stay at -1) and pool lists those rows.
+        ``state`` is the cache state the scores refer to; ranking must use the same one.
+        """
+        state = self._state
+        encoded = self._encode_queries(queries)
+        q_mat = np.stack([q_vec for q_vec, _ in encoded], axis=0)
+        if state.ann_index is None:
+            dense = _dense_scores_batch(state.embeddings, q_mat)
+            return [(state, q_vec, q_sparse, dense[i], None) for i, (q_vec, q_sparse) in enumerate(encoded)]
+
+        q_norm = _normalize_rows(q_mat)
+        results = []
+        for i, (q_vec, q_sparse) in enumerate(encoded):
+            rows, scores = state.ann_index.search(state.embeddings, q_norm[i], self.ann_candidates, self.ann_nprobe)
+            dense_sims = np.full(state.n_docs, -1.0, dtype=np.float32)
+            dense_sims[rows] = scores
+            results.append((state, q_vec, q_sparse, dense_sims, rows))
+        return results
 
     def retrieve(self, query: str, top_k: Optional[int] = None) -> List[Dict[str, Any]]:
         """Retrieve relevant docs; dedup by post_id/permalink_url."""
@@ -220,15 +857,52 @@ class RAGRetriever:
         if not query or not query.strip():
             return []
 
-        q_vec, q_sparse = self._encode_query(query)
-        dense_sims = _cosine_sim(q_vec, self.embeddings)[0]
-        dense_norm = (dense_sims + 1.0) / 2.0
+        if self.batcher is not None:
+            state, q_vec, q_sparse, dense_sims, pool = self.batcher.submit(query)
+        else:
+            state, q_vec, q_sparse, dense_sims, pool = self._encode_and_score_batch([query])[0]
+        results = self._rank(state, query, q_vec, q_sparse, dense_sims, pool, top_k)
+        if pool is not None and len(results) < top_k:
+            # Pool ANN không đủ post khác nhau sau dedup -> quay về brute force
+            dense_sims = _dense_scores(state.embeddings, q_vec)
+            results = self._rank(state, query, q_vec, q_sparse, dense_sims, None, top_k)
+        return results
 
-        if self.use_hybrid and q_sparse is not None and self.sparse_embeddings:
-            sparse_sims = np.array(
-                [_sparse_sim(q_sparse, s) for s in self.sparse_embeddings],
-                dtype=np.float32,
-            )
+    def _rank(
+        self,
+        state: _CacheState,
+        query: str,
+        q_vec: np.ndarray,
+        q_sparse: Optional[Dict[int, float]],
+        dense_sims: np.ndarray,
+        pool: Optional[np.ndarray],
+        top_k: int,
+    ) -> List[Dict[str, Any]]:
+        """Hybrid scoring + phrase boost + dedup; with an ANN pool only pool docs are ranked."""
+        sparse_index = state.sparse_index
+        sparse_sims = None
+        if self.use_hybrid and q_sparse is not None and sparse_index is not None and sparse_index.n_docs:
+            sparse_sims = sparse_index.scores(q_sparse)
+
+        quoted_phrases = _extract_quoted_phrases(query)
+        # Trigram index: chỉ verify các doc chứa đủ trigram của cụm, không quét toàn bộ text
+        phrase_hits = state.phrase_index.matches(quoted_phrases) if quoted_phrases else None
+        if pool is not None:
+            # Không bỏ sót doc khớp từ khóa (sparse) hoặc cụm "..." mà IVF không probe tới
+            extra = []
+            if sparse_sims is not None:
+                top_sparse = _top_k_indices(sparse_sims, self.ann_candidates)
+                extra.append(top_sparse[sparse_sims[top_sparse] > 0])
+            if phrase_hits is not None:
+                extra.append(phrase_hits)
+            if extra:
+                extra_idx = np.setdiff1d(np.concatenate(extra), pool)
+                if extra_idx.size:
+                    dense_sims[extra_idx] = _dense_scores(state.embeddings[extra_idx], q_vec)
+                    pool = np.concatenate([pool, extra_idx])
+
+        dense_norm = (dense_sims + 1.0) / 2.0
+        if sparse_sims is not None:
             if sparse_sims.size > 0 and sparse_sims.max() > sparse_sims.min():
                 sparse_sims = (sparse_sims - sparse_sims.min()) / (sparse_sims.max() - sparse_sims.min() + 1e-8)
             else:
@@ -238,68 +912,171 @@ class RAGRetriever:
             final_scores = np.array(dense_norm, dtype=np.float32, copy=True)
 
         # Exact phrase boost: query có cụm trong ngoặc kép "..." thì tăng điểm doc chứa đúng cụm đó
-        quoted_phrases = _extract_quoted_phrases(query)
-        if quoted_phrases:
-            for i, text in enumerate(self.doc_texts):
-                text_lower = (text or "").lower()
-                if all(phrase in text_lower for phrase in quoted_phrases):
-                    final_scores[i] += 0.35
+        if phrase_hits is not None:
+            final_scores[phrase_hits] += 0.35
             final_scores = np.clip(final_scores, 0.0, 1.5)
 
+        candidates = pool
         if self.min_score is not None:
-            valid = np.where(final_scores >= self.min_score)[0]
-            if len(valid) == 0:
-                sorted_idx = np.argsort(-final_scores)
+            if pool is None:
+                valid = np.where(final_scores >= self.min_score)[0]
             else:
-                sorted_idx = valid[np.argsort(-final_scores[valid])]
-        else:
-            sorted_idx = np.argsort(-final_scores)
+                valid = pool[final_scores[pool] >= self.min_score]
+            if len(valid) > 0:
+                candidates = valid
+
+        # Partial top-k: chỉ sort ~top_k * overfetch ứng viên; nếu dedup theo post_id
+        # chưa đủ top_k kết quả thì nới rộng pool (x4) cho tới khi đủ hoặc hết doc.
+        pool_size = len(final_scores) if candidates is None else len(candidates)
+        fetch = min(pool_size, max(top_k * self.overfetch, top_k + 16))
+        while True:
+            sorted_idx = _top_k_indices(final_scores, fetch, candidates)
+            results = self._collect_results(state, sorted_idx, final_scores, dense_sims, top_k)
+            if len(results) >= top_k or fetch >= pool_size:
+                return results
+            fetch = min(pool_size, fetch * 4)
+
+    def _collect_results(
+        self,
+        state: _CacheState,
+        sorted_idx: np.ndarray,
+        final_scores: np.ndarray,
+        dense_sims: np.ndarray,
+        top_k: int,
+    ) -> List[Dict[str, Any]]:
+        """
+        Walk ranked indices and keep the top_k docs with distinct post_id/permalink_url.
 
-        seen_keys: set = set()
-        results: List[Dict[str, Any]] = []
+        The best doc of each post stands for it; other chunks of the same document
+        further down add to its score (CHUNK_SCORE_WEIGHT), which can reorder posts.
+        A chunk is scored on its own but returned as its whole document (doc_id and full text).
+        """
+        by_key: Dict[Any, Dict[str, Any]] = {}
+        rows: Dict[Any, int] = {}
+        parents: Dict[Any, str] = {}
+        extra: Dict[Any, List[float]] = {}
         for idx in sorted_idx:
-            src = self.doc_sources[idx] or {}
-            dedup_key = src.get("post_id") or src.get("permalink_url") or self.doc_ids[idx]
-            if dedup_key in seen_keys:
+            src = state.doc_sources[idx] or {}
+            dedup_key = src.get("post_id") or src.get("permalink_url") or state.doc_ids[idx]
+            if dedup_key in by_key:
+                chunk_scores = extra[dedup_key]
+                if (
+                    len(chunk_scores) < CHUNK_SCORE_MAX_EXTRA
+                    and parent_doc_id(str(state.doc_ids[idx])) == parents[dedup_key]
+                ):
+                    chunk_scores.append(float(final_scores[idx]))
                 continue
-            seen_keys.add(dedup_key)
-            results.append({
-                "_id": self.doc_ids[idx],
+            result = {
+                "_id": state.doc_ids[idx],
                 "score": float(final_scores[idx]),
                 "dense_score": float(dense_sims[idx]),
-                "text": self.doc_texts[idx],
+                "text": state.doc_texts[idx],
                 "source": src,
-            })
-            if len(results) >= top_k:
-                break
-        return results
+            }
+            by_key[dedup_key] = result
+            rows[dedup_key] = int(idx)
+            parents[dedup_key] = parent_doc_id(str(state.doc_ids[idx]))
+            extra[dedup_key] = []
+
+        for dedup_key, chunk_scores in extra.items():
+            if chunk_scores:
+                by_key[dedup_key]["score"] += CHUNK_SCORE_WEIGHT * sum(chunk_scores)
+        # sort ổn định: không có chunk thì thứ tự giữ nguyên như sorted_idx
+        top = sorted(by_key, key=lambda k: by_key[k]["score"], reverse=True)[:top_k]
+        # Context cho LLM là cả bài / cả thread, không chỉ cửa sổ ~512 token khớp nhất
+        parents = {k: self._chunk_parent(state, rows[k]) for k in top}
+        chunked = [parent for parent in parents.values() if parent is not None]
+        full_texts = self._full_texts(state, chunked) if chunked else {}
+        for dedup_key, parent in parents.items():
+            if parent in full_texts:
+                by_key[dedup_key]["_id"] = parent
+                by_key[dedup_key]["text"] = full_texts[parent]
+        return [by_key[k] for k in top]
+
+    def _chunk_parent(self, state: _CacheState, idx: int) -> Optional[str]:
+        """doc_id of the chunked document cached row ``idx`` belongs to, None if not chunked."""
+        doc_id = str(state.doc_ids[idx])
+        parent = parent_doc_id(doc_id)
+        if parent != doc_id:
+            return parent
+        # Chunk đầu giữ doc_id gốc: cờ theo row tính sẵn trong PostLookup
+        if state.post_lookup.is_chunked(idx):
+            return doc_id
+        return None
+
+    def _full_texts(self, state: _CacheState, doc_ids: List[str]) -> Dict[str, str]:
+        """
+        Whole text of chunked documents (payload ``full_text`` of their first chunk).
+
+        Fetched by point id and kept in a bounded LRU keyed by collection version;
+        documents whose text could not be fetched are left out (callers keep the chunk text).
+        """
+        found: Dict[str, str] = {}
+        missing: List[str] = []
+        for d in doc_ids:
+            text = self.full_text_cache.get((state.version, d))
+            if text is None:
+                missing.append(d)
+            else:
+                found[d] = text
+        if missing:
+            try:
+                points = self.qdrant_client.retrieve(
+                    collection_name=self.collection_name,
+                    ids=[doc_point_id(d) for d in missing],
+                    with_payload=["doc_id", "full_text"],
+                    with_vectors=False,
+                )
+            except Exception as e:
+                print(f"Warning: fetching full text of chunked documents failed: {e}")
+                points = []
+            for p in points:
+                payload = p.payload or {}
+                if payload.get("full_text"):
+                    doc_id = str(payload.get("doc_id", ""))
+                    found[doc_id] = str(payload["full_text"])
+                    self.full_text_cache.put((state.version, doc_id), found[doc_id])
+        return found
 
     def get_post_by_id(self, post_id: str) -> Optional[Dict[str, Any]]:
-        """Get post by post_id from cache or Qdrant."""
-        doc_id = f"post::{post_id}"
-        try:
-            idx = self.doc_ids.index(doc_id)
+        """Get post by post_id from cache (O(1) lookup) or one keyed fetch from Qdrant."""
+        state = self._state
+        idx = state.post_lookup.post(post_id)
+        if idx is not None:
+            doc_id = str(state.doc_ids[idx])
+            text = state.doc_texts[idx]
+            if self._chunk_parent(state, idx) is not None:
+                text = self._full_texts(state, [doc_id]).get(doc_id, text)
             return {
-                "_id": self.doc_ids[idx],
-                "text": self.doc_texts[idx],
-                "source": self.doc_sources[idx],
+                "_id": doc_id,
+                "text": text,
+                "source": state.doc_sources[idx],
                 "score": 1.0,
             }
-        except ValueError:
-            pass
-
-        # Scroll và tìm post theo doc_id (không dùng filter vì Qdrant Cloud cần payload index)
-        all_points = self._scroll_all_points(with_payload=True, with_vectors=False, batch_size=500)
-        for p in all_points:
-            payload = p.payload or {}
-            if payload.get("type") == "post" and payload.get("doc_id") == doc_id:
-                return {
-                    "_id": str(payload.get("doc_id", "")),
-                    "text": str(payload.get("text", "")),
-                    "source": dict(payload.get("source", {}) or {}),
-                    "score": 1.0,
-                }
-        return None
+
+        # Post không có trong cache (vd. chưa có embedding): point id suy ra từ doc_id
+        # (UUIDv5, xem index_mongo.py) -> 1 lần retrieve theo id, không cần filter hay scroll.
+        doc_id = f"post::{post_id}"
+        try:
+            points = self.qdrant_client.retrieve(
+                collection_name=self.collection_name,
+                ids=[doc_point_id(doc_id)],
+                with_payload=["doc_id", "text", "full_text", "source", "deleted"],
+                with_vectors=False,
+            )
+        except Exception as e:
+            print(f"Warning: keyed fetch of {doc_id} failed: {e}")
+            return None
+        if not points or (points[0].payload or {}).get("deleted"):
+            return None
+        payload = points[0].payload or {}
+        return {
+            "_id": str(payload.get("doc_id", "")),
+            # Post dài: point là chunk đầu, full_text là cả bài
+            "text": str(payload.get("full_text") or payload.get("text", "")),
+            "source": dict(payload.get("source", {}) or {}),
+            "score": 1.0,
+        }
 
 
 def build_context(retrieved_docs: List[Dict[str, Any]]) -> str:
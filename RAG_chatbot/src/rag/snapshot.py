@@ -0,0 +1,239 @@
+"""
+On-disk snapshot of RAGRetriever caches, loaded back with mmap.
+
+Layout of ``<snapshot_dir>/<collection>/``:
+    meta.json                  collection version, sync watermark, shapes, dtype, counts
+    embeddings.npy             normalized dense matrix (N x dim)
+    sparse_{vocab,indptr,indices,data}.npy   CSR arrays of SparseIndex (hybrid only)
+    {point_ids,doc_ids,texts,sources}.bin + *_offsets.npy   offset-indexed utf-8 / JSON blobs
+    comment_{keys,values}.bin + *_offsets.npy     comments_by_post (post_id -> JSON list)
+    texts_lower.bin + phrase_{keys,indptr,docs}.npy   PhraseIndex (trigram postings)
+    lookup_post_ids.bin + lookup_*.npy            PostLookup (post_id -> rows)
+
+All arrays are opened with ``mmap_mode="r"`` so several worker processes share the
+same page-cache pages instead of each holding its own copy.
+"""
+
+import json
+import os
+import shutil
+from collections.abc import Mapping, Sequence
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from .phrase_index import PhraseIndex
+from .post_lookup import PostLookup
+from .sparse_index import SparseIndex
+
+SNAPSHOT_FORMAT = 4
+
+
+class BlobList(Sequence):
+    """Read-only list view over an offset-indexed byte blob (decoded on access)."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray, decode: Callable[[bytes], Any]) -> None:
+        self._blob = blob
+        self._offsets = offsets
+        self._decode = decode
+
+    def __len__(self) -> int:
+        return int(self._offsets.shape[0]) - 1
+
+    def __getitem__(self, idx):  # type: ignore[override]
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        start, end = int(self._offsets[idx]), int(self._offsets[idx + 1])
+        return self._decode(self._blob[start:end].tobytes())
+
+
+class BlobMapping(Mapping):
+    """Read-only dict view: key -> value decoded lazily from a BlobList."""
+
+    def __init__(self, keys: Sequence, values: BlobList) -> None:
+        self._index = {k: i for i, k in enumerate(keys)}
+        self._values = values
+
+    def __getitem__(self, key: Any) -> Any:
+        return self._values[self._index[key]]
+
+    def __iter__(self) -> Iterator:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+def _decode_str(raw: bytes) -> str:
+    return raw.decode("utf-8")
+
+
+def _decode_json(raw: bytes) -> Any:
+    return json.loads(raw.decode("utf-8"))
+
+
+def _write_blob(directory: Path, name: str, items: Iterable[bytes]) -> None:
+    offsets = [0]
+    with open(directory / f"{name}.bin", "wb") as f:
+        for raw in items:
+            f.write(raw)
+            offsets.append(offsets[-1] + len(raw))
+    np.save(directory / f"{name}_offsets.npy", np.asarray(offsets, dtype=np.int64))
+
+
+def _read_blob(directory: Path, name: str, decode: Callable[[bytes], Any]) -> BlobList:
+    offsets = np.load(directory / f"{name}_offsets.npy", mmap_mode="r")
+    if int(offsets[-1]) == 0:
+        blob = np.zeros(0, dtype=np.uint8)  # np.memmap không map được file rỗng
+    else:
+        blob = np.memmap(directory / f"{name}.bin", dtype=np.uint8, mode="r")
+    return BlobList(blob, offsets, decode)
+
+
+def _json_bytes(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+
+
+def save_snapshot(
+    path: Path,
+    *,
+    collection_version: str,
+    embeddings: np.ndarray,
+    point_ids: List[Any],
+    doc_ids: Sequence,
+    doc_texts: Sequence,
+    doc_sources: Sequence,
+    sparse_index: Optional[SparseIndex],
+    phrase_index: PhraseIndex,
+    post_lookup: PostLookup,
+    comments_by_post: Mapping,
+    synced_at: float = 0.0,
+) -> None:
+    """Write the snapshot to a temp dir next to ``path`` and swap it in with a rename."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.parent / f".{path.name}.tmp-{os.getpid()}"
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir()
+
+    np.save(tmp / "embeddings.npy", np.ascontiguousarray(embeddings))
+    _write_blob(tmp, "point_ids", (_json_bytes(p) for p in point_ids))
+    _write_blob(tmp, "doc_ids", (str(d).encode("utf-8") for d in doc_ids))
+    _write_blob(tmp, "texts", (str(t).encode("utf-8") for t in doc_texts))
+    _write_blob(tmp, "sources", (_json_bytes(s or {}) for s in doc_sources))
+    if sparse_index is not None:
+        np.save(tmp / "sparse_vocab.npy", sparse_index.vocab)
+        np.save(tmp / "sparse_indptr.npy", sparse_index.indptr)
+        np.save(tmp / "sparse_indices.npy", sparse_index.indices)
+        np.save(tmp / "sparse_data.npy", sparse_index.data)
+    _write_blob(tmp, "texts_lower", (t.encode("utf-8") for t in phrase_index.texts_lower))
+    np.save(tmp / "phrase_keys.npy", phrase_index.keys)
+    np.save(tmp / "phrase_indptr.npy", phrase_index.indptr)
+    np.save(tmp / "phrase_docs.npy", phrase_index.docs)
+    _write_blob(tmp, "lookup_post_ids", (str(p).encode("utf-8") for p in post_lookup.post_ids))
+    np.save(tmp / "lookup_post_row.npy", post_lookup.post_row)
+    np.save(tmp / "lookup_thread_row.npy", post_lookup.thread_row)
+    np.save(tmp / "lookup_ctx_indptr.npy", post_lookup.ctx_indptr)
+    np.save(tmp / "lookup_ctx_rows.npy", post_lookup.ctx_rows)
+    np.save(tmp / "lookup_chunked_rows.npy", post_lookup.chunked_rows)
+    keys = list(comments_by_post.keys())
+    _write_blob(tmp, "comment_keys", (str(k).encode("utf-8") for k in keys))
+    _write_blob(tmp, "comment_values", (_json_bytes(comments_by_post[k]) for k in keys))
+
+    meta = {
+        "format": SNAPSHOT_FORMAT,
+        "collection_version": collection_version,
+        "n_docs": int(embeddings.shape[0]),
+        "dim": int(embeddings.shape[1]),
+        "dtype": str(embeddings.dtype),
+        "has_sparse": sparse_index is not None,
+        "n_comments": int(sum(len(comments_by_post[k]) for k in keys)),
+        "n_comment_posts": len(keys),
+        # max payload updated_at đã nạp: mốc để RAGRetriever.refresh() chỉ lấy point mới/đổi
+        "synced_at": float(synced_at),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    # meta.json ghi cuối cùng: snapshot thiếu meta = chưa hoàn chỉnh
+    with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    # Process khác đang mmap bản cũ vẫn đọc được (POSIX giữ inode tới khi unmap)
+    old = path.parent / f".{path.name}.old-{os.getpid()}"
+    if path.exists():
+        os.replace(path, old)
+    os.replace(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def read_snapshot_meta(path: Path) -> Optional[Dict[str, Any]]:
+    """Return meta.json of a snapshot, or None if missing/corrupt."""
+    try:
+        with open(Path(path) / "meta.json", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("format") != SNAPSHOT_FORMAT:
+        return None
+    return meta
+
+
+def load_snapshot(path: Path, collection_version: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Map a snapshot from disk if it matches collection_version.
+
+    Returns None when the snapshot is missing, stale or unreadable (caller rebuilds).
+    """
+    path = Path(path)
+    meta = read_snapshot_meta(path)
+    if meta is None or collection_version is None:
+        return None
+    if meta.get("collection_version") != collection_version:
+        return None
+    try:
+        embeddings = np.load(path / "embeddings.npy", mmap_mode="r")
+        sparse_index = None
+        if meta.get("has_sparse"):
+            sparse_index = SparseIndex(
+                np.load(path / "sparse_vocab.npy", mmap_mode="r"),
+                np.load(path / "sparse_indptr.npy", mmap_mode="r"),
+                np.load(path / "sparse_indices.npy", mmap_mode="r"),
+                np.load(path / "sparse_data.npy", mmap_mode="r"),
+                meta["n_docs"],
+            )
+        phrase_index = PhraseIndex(
+            _read_blob(path, "texts_lower", _decode_str),
+            np.load(path / "phrase_keys.npy", mmap_mode="r"),
+            np.load(path / "phrase_indptr.npy", mmap_mode="r"),
+            np.load(path / "phrase_docs.npy", mmap_mode="r"),
+        )
+        post_lookup = PostLookup(
+            list(_read_blob(path, "lookup_post_ids", _decode_str)),
+            np.load(path / "lookup_post_row.npy", mmap_mode="r"),
+            np.load(path / "lookup_thread_row.npy", mmap_mode="r"),
+            np.load(path / "lookup_ctx_indptr.npy", mmap_mode="r"),
+            np.load(path / "lookup_ctx_rows.npy", mmap_mode="r"),
+            np.load(path / "lookup_chunked_rows.npy", mmap_mode="r"),
+        )
+        comment_keys = list(_read_blob(path, "comment_keys", _decode_str))
+        return {
+            "meta": meta,
+            "embeddings": embeddings,
+            "point_ids": list(_read_blob(path, "point_ids", _decode_json)),
+            "doc_ids": _read_blob(path, "doc_ids", _decode_str),
+            "doc_texts": _read_blob(path, "texts", _decode_str),
+            "doc_sources": _read_blob(path, "sources", _decode_json),
+            "sparse_index": sparse_index,
+            "phrase_index": phrase_index,
+            "post_lookup": post_lookup,
+            "comments_by_post": BlobMapping(comment_keys, _read_blob(path, "comment_values", _decode_json)),
+        }
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: snapshot at {path} unreadable ({e}); rebuilding from Qdrant.")
+        return None
@@ -0,0 +1,147 @@
+"""CSR sparse-weight matrix for BGE-M3 lexical (sparse) scoring."""
+
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+# (token ids int64, weights float32) của 1 document
+SparseRow = Tuple[np.ndarray, np.ndarray]
+
+
+def clean_sparse_weights(raw: Any) -> Dict[int, float]:
+    """Convert a BGE-M3 / payload sparse dict (str or int keys) into {token_id: weight}."""
+    cleaned: Dict[int, float] = {}
+    if not isinstance(raw, dict):
+        return cleaned
+    for k, v in raw.items():
+        try:
+            cleaned[int(k)] = float(v)
+        except (TypeError, ValueError):
+            continue
+    return cleaned
+
+
+def sparse_row(raw: Any) -> Optional[SparseRow]:
+    """
+    (token ids, weights) of a native Qdrant sparse vector (``indices``/``values``, taken
+    as whole arrays) or of a payload / BGE-M3 dict (cleaned entry by entry).
+    """
+    if raw is None:
+        return None
+    indices = getattr(raw, "indices", None)
+    if indices is not None:
+        if not len(indices):
+            return None
+        return np.asarray(indices, dtype=np.int64), np.asarray(raw.values, dtype=np.float32)
+    weights = clean_sparse_weights(raw)
+    if not weights:
+        return None
+    return (
+        np.fromiter(weights.keys(), dtype=np.int64, count=len(weights)),
+        np.fromiter(weights.values(), dtype=np.float32, count=len(weights)),
+    )
+
+
+def _concat(tok_parts: list, doc_parts: list, w_parts: list) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    if not tok_parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+    return (
+        np.concatenate(tok_parts).astype(np.int64, copy=False),
+        np.concatenate(doc_parts).astype(np.int32, copy=False),
+        np.concatenate(w_parts).astype(np.float32, copy=False),
+    )
+
+
+class SparseIndex:
+    """
+    Sparse weights packed as one CSR matrix of shape (vocab x docs).
+
+    Row r holds every (doc, weight) pair for token ``vocab[r]``, so scoring a query is a
+    single sparse mat-vec: only the rows of tokens present in the query are touched.
+    """
+
+    def __init__(
+        self,
+        vocab: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        data: np.ndarray,
+        n_docs: int,
+    ) -> None:
+        self.vocab = vocab          # sorted unique token ids, shape (V,)
+        self.indptr = indptr        # shape (V + 1,)
+        self.indices = indices      # doc row per non-zero, shape (nnz,)
+        self.data = data            # weight per non-zero, shape (nnz,)
+        self.n_docs = int(n_docs)
+
+    @classmethod
+    def from_dicts(cls, sparse_list: Iterable[Optional[Dict[int, float]]]) -> "SparseIndex":
+        """Build the CSR matrix from one {token_id: weight} dict per document."""
+        return cls.from_rows(sparse_row(sparse) for sparse in sparse_list)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Optional[SparseRow]]) -> "SparseIndex":
+        """Build the CSR matrix from one (token ids, weights) row per document."""
+        tok_parts, doc_parts, w_parts = [], [], []
+        n_docs = 0
+        for doc_idx, row in enumerate(rows):
+            n_docs = doc_idx + 1
+            if row is None or not len(row[0]):
+                continue
+            tok_parts.append(row[0])
+            doc_parts.append(np.full(len(row[0]), doc_idx, dtype=np.int32))
+            w_parts.append(row[1])
+        return cls._from_triplets(*_concat(tok_parts, doc_parts, w_parts), n_docs)
+
+    @classmethod
+    def _from_triplets(cls, tok: np.ndarray, doc: np.ndarray, w: np.ndarray, n_docs: int) -> "SparseIndex":
+        order = np.lexsort((doc, tok))
+        tok, doc, w = tok[order], doc[order], w[order]
+        vocab, counts = np.unique(tok, return_counts=True)
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(vocab, indptr, doc, w, n_docs)
+
+    def updated(self, rows: Dict[int, Optional[SparseRow]], n_docs: int) -> "SparseIndex":
+        """Copy with the weights of ``rows`` replaced (rows >= self.n_docs are new documents)."""
+        tok = np.repeat(np.asarray(self.vocab, dtype=np.int64), np.diff(self.indptr))
+        doc = np.asarray(self.indices, dtype=np.int32)
+        w = np.asarray(self.data, dtype=np.float32)
+        if rows:
+            keep = ~np.isin(doc, np.fromiter(rows.keys(), dtype=np.int32, count=len(rows)))
+            tok, doc, w = tok[keep], doc[keep], w[keep]
+
+        tok_parts, doc_parts, w_parts = [tok], [doc], [w]
+        for doc_idx, row in rows.items():
+            if row is None or not len(row[0]):
+                continue
+            tok_parts.append(row[0])
+            doc_parts.append(np.full(len(row[0]), doc_idx, dtype=np.int32))
+            w_parts.append(row[1])
+        return self._from_triplets(*_concat(tok_parts, doc_parts, w_parts), n_docs)
+
+    @property
+    def nnz(self) -> int:
+        return int(self.indices.shape[0])
+
+    def docs_with_weights(self) -> int:
+        """Number of documents that have at least one sparse weight."""
+        if self.nnz == 0:
+            return 0
+        return int(np.unique(self.indices).shape[0])
+
+    def scores(self, query_sparse: Optional[Dict[int, float]]) -> np.ndarray:
+        """Dot product of the query weights with every document (raw, un-normalized)."""
+        out = np.zeros(self.n_docs, dtype=np.float64)
+        if not query_sparse or self.nnz == 0:
+            return out.astype(np.float32)
+
+        q_tok = np.fromiter(query_sparse.keys(), dtype=np.int64, count=len(query_sparse))
+        q_w = np.fromiter(query_sparse.values(), dtype=np.float64, count=len(query_sparse))
+        rows = np.searchsorted(self.vocab, q_tok)
+        rows_clipped = np.minimum(rows, len(self.vocab) - 1)
+        hit = self.vocab[rows_clipped] == q_tok
+        for row, weight in zip(rows_clipped[hit], q_w[hit]):
+            start, end = self.indptr[row], self.indptr[row + 1]
+            out[self.indices[start:end]] += weight * self.data[start:end]
+        return out.astype(np.float32)
@@ -7,9 +7,31 @@ from .config import (
     QDRANT_URL,
     QDRANT_KEY,
     QDRANT_COLLECTION_NAME,
+    RETRIEVER_SNAPSHOT_DIR,
+    PIPELINE_STATE_DIR,
     get_mongo_client,
     get_qdrant_client,
 )
+from .collection_meta import (
+    COLLECTION_META_POINT_ID,
+    COLLECTION_META_TYPE,
+    CHUNK_SEPARATOR,
+    bump_collection_version,
+    chunk_doc_id,
+    doc_point_id,
+    get_collection_version,
+    parent_doc_id,
+)
+from .vectors import (
+    DENSE_VECTOR_NAME,
+    SPARSE_VECTOR_NAME,
+    create_named_collection,
+    dense_vector,
+    point_vector,
+    sparse_vector,
+    uses_named_vectors,
+    vector_selector,
+)
 
 __all__ = [
     "MONGO_URI",
@@ -18,7 +40,25 @@ __all__ = [
     "QDRANT_URL",
     "QDRANT_KEY",
     "QDRANT_COLLECTION_NAME",
+    "RETRIEVER_SNAPSHOT_DIR",
+    "PIPELINE_STATE_DIR",
+    "COLLECTION_META_POINT_ID",
+    "COLLECTION_META_TYPE",
+    "CHUNK_SEPARATOR",
     "get_mongo_client",
     "get_qdrant_client",
+    "bump_collection_version",
+    "chunk_doc_id",
+    "doc_point_id",
+    "get_collection_version",
+    "parent_doc_id",
+    "DENSE_VECTOR_NAME",
+    "SPARSE_VECTOR_NAME",
+    "create_named_collection",
+    "dense_vector",
+    "point_vector",
+    "sparse_vector",
+    "uses_named_vectors",
+    "vector_selector",
 ]
 
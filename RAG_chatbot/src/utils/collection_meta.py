@@ -0,0 +1,88 @@
+"""
+Collection version marker stored as a reserved point in the Qdrant collection,
+plus the deterministic point ids of knowledge documents (and their chunks).
+
+Pipeline scripts bump the version after they change the collection; the retriever
+compares it with its on-disk snapshot to decide whether the snapshot is stale.
+"""
+
+import time
+import uuid
+from typing import Any, Optional
+
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import PointStruct
+
+COLLECTION_META_TYPE = "collection_meta"
+# Id cố định (UUIDv5) để đọc/ghi marker bằng 1 lần retrieve theo id, không cần scroll
+COLLECTION_META_POINT_ID = str(uuid.uuid5(uuid.NAMESPACE_URL, "rag-chatbot/collection_meta"))
+
+_DOC_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "rag-chatbot/doc")
+
+
+def doc_point_id(doc_id: str) -> str:
+    """Stable Qdrant point id of a knowledge document (UUIDv5 of e.g. ``post::<id>``)."""
+    return str(uuid.uuid5(_DOC_ID_NAMESPACE, doc_id))
+
+
+# Document dài được chia chunk: chunk 0 giữ doc_id gốc, chunk i > 0 là "<doc_id>#<i>"
+CHUNK_SEPARATOR = "#"
+
+
+def chunk_doc_id(doc_id: str, index: int) -> str:
+    """doc_id of chunk ``index`` of a chunked document."""
+    return doc_id if index == 0 else f"{doc_id}{CHUNK_SEPARATOR}{index}"
+
+
+def parent_doc_id(doc_id: str) -> str:
+    """doc_id of the whole document a chunk belongs to (itself for unchunked documents)."""
+    return doc_id.split(CHUNK_SEPARATOR, 1)[0]
+
+
+def get_collection_version(client: QdrantClient, collection_name: str) -> Optional[str]:
+    """
+    Return the collection version stamped by the pipeline scripts.
+
+    Collections indexed before the marker existed fall back to ``points:<count>``,
+    which still changes whenever points are added or removed.
+    """
+    try:
+        points = client.retrieve(
+            collection_name=collection_name,
+            ids=[COLLECTION_META_POINT_ID],
+            with_payload=True,
+            with_vectors=False,
+        )
+    except Exception:
+        points = []
+    if points:
+        version = (points[0].payload or {}).get("version")
+        if version:
+            return str(version)
+    try:
+        info = client.get_collection(collection_name)
+    except Exception:
+        return None
+    return f"points:{info.points_count}"
+
+
+def bump_collection_version(client: QdrantClient, collection_name: str, vector: Any) -> str:
+    """Stamp a new random version on the collection and return it."""
+    version = uuid.uuid4().hex
+    client.upsert(
+        collection_name=collection_name,
+        points=[
+            PointStruct(
+                id=COLLECTION_META_POINT_ID,
+                vector=vector,
+                payload={
+                    "type": COLLECTION_META_TYPE,
+                    "version": version,
+                    # Epoch float như mọi point khác (payload index FLOAT, range filter của refresh)
+                    "updated_at": time.time(),
+                },
+            )
+        ],
+        wait=True,
+    )
+    return version
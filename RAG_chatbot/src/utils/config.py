@@ -6,6 +6,8 @@ This is the SINGLE source of truth — scripts/ re-exports from here.
 """
 
 import os
+from pathlib import Path
+
 from dotenv import load_dotenv
 from pymongo import MongoClient
 from qdrant_client import QdrantClient
@@ -33,6 +35,15 @@ if not QDRANT_URL:
 QDRANT_KEY = os.getenv("QDRANT_KEY")
 QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME", "knowledge_base")
 
+# --- Retriever snapshot (mmap cache on disk, shared by API / CLI / Streamlit processes) ---
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+RETRIEVER_SNAPSHOT_DIR = os.getenv(
+    "RETRIEVER_SNAPSHOT_DIR", str(_PROJECT_ROOT / ".cache" / "retriever")
+)
+
+# --- Pipeline state (checkpoints of scripts/pipeline.py, per collection) ---
+PIPELINE_STATE_DIR = os.getenv("PIPELINE_STATE_DIR", str(_PROJECT_ROOT / ".cache" / "pipeline"))
+
 
 def get_mongo_client() -> MongoClient:
     """Get MongoDB client instance."""
@@ -0,0 +1,66 @@
+"""
+Vector layout of the knowledge base collection.
+
+Current layout: a named dense vector (``dense``) plus a named native sparse vector
+(``sparse``). Legacy collections have one unnamed dense vector and keep the sparse
+weights in the payload (``sparse_embedding``); readers handle both,
+scripts/migrate_named_vectors.py converts the legacy one.
+"""
+
+from typing import Any, Dict, List, Optional
+
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, SparseVector, SparseVectorParams, VectorParams
+
+DENSE_VECTOR_NAME = "dense"
+SPARSE_VECTOR_NAME = "sparse"
+
+
+def create_named_collection(client: QdrantClient, collection_name: str, dim: int) -> None:
+    """Create a collection with the named dense + sparse layout."""
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config={DENSE_VECTOR_NAME: VectorParams(size=dim, distance=Distance.COSINE)},
+        sparse_vectors_config={SPARSE_VECTOR_NAME: SparseVectorParams()},
+    )
+
+
+def uses_named_vectors(client: QdrantClient, collection_name: str) -> bool:
+    """True if the collection has the named dense/sparse layout (False if legacy or missing)."""
+    try:
+        info = client.get_collection(collection_name)
+    except Exception:
+        return False
+    vectors = info.config.params.vectors
+    return isinstance(vectors, dict) and DENSE_VECTOR_NAME in vectors
+
+
+def vector_selector(named: bool, with_sparse: bool) -> Any:
+    """``with_vectors`` argument that fetches the dense (and sparse) vector in either layout."""
+    if not named:
+        return True
+    return [DENSE_VECTOR_NAME] + ([SPARSE_VECTOR_NAME] if with_sparse else [])
+
+
+def dense_vector(vector: Any) -> Any:
+    """Dense part of a fetched point vector (named layout: ``vector["dense"]``)."""
+    if isinstance(vector, dict):
+        return vector.get(DENSE_VECTOR_NAME)
+    return vector
+
+
+def sparse_vector(vector: Any) -> Optional[SparseVector]:
+    """Native sparse part of a fetched point vector, None in the legacy layout."""
+    if isinstance(vector, dict):
+        return vector.get(SPARSE_VECTOR_NAME)
+    return None
+
+
+def point_vector(named: bool, dense: List[float], sparse: Optional[Dict[int, float]] = None) -> Any:
+    """``PointStruct.vector`` for the layout (legacy: dense only, sparse stays in the payload)."""
+    if not named:
+        return dense
+    vector: Dict[str, Any] = {DENSE_VECTOR_NAME: dense}
+    if sparse:
+        vector[SPARSE_VECTOR_NAME] = SparseVector(indices=list(sparse.keys()), values=list(sparse.values()))
+    return vector
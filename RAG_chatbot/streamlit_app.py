@@ -48,8 +48,8 @@ if page == "Pipeline Runner":
     step = st.selectbox(
         "Chạy ở bước",
         [
-            "1. Index Mongo → Qdrant",
-            "2. Generate Embeddings (BGE-M3)",
+            "1. Index Mongo → Qdrant (kèm embedding)",
+            "2. Generate Embeddings (BGE-M3, point còn thiếu)",
             "Chạy toàn bộ (1 rồi 2)",
         ],
     )